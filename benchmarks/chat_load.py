@@ -0,0 +1,88 @@
+"""
+    Concurrent chat throughput against a running API worker.
+
+    Sends --requests chat messages with --concurrency in flight to
+    POST /api/projects/{project_id}/chats/{chat_id}/messages and reports
+    throughput and latency percentiles. Run it against a single uvicorn worker
+    (uvicorn main:app --workers 1) before and after a change: with blocking
+    calls in the handler, throughput stays flat as concurrency grows; with a
+    non-blocking handler it scales until the LLM / database become the limit.
+
+    Usage: python benchmarks/chat_load.py --project-id P --chat-id C --token JWT
+               [--base-url http://localhost:8000] [--concurrency 1 4 16] [--requests 32]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+QUESTIONS = [
+    "Summarize the main findings of the documents.",
+    "What figures or tables are mentioned, and what do they show?",
+    "List the key terms defined in the documents.",
+    "What recommendations are made?",
+]
+
+
+def percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+async def run_level(client, url: str, total_requests: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def send(i: int):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.post(url, json={"content": QUESTIONS[i % len(QUESTIONS)]})
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                errors += 1
+                print(f"⚠️ Request {i} failed: {e}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send(i) for i in range(total_requests)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "ok": len(latencies),
+        "errors": errors,
+        "requests_per_second": len(latencies) / elapsed if elapsed else 0,
+        "p50": statistics.median(latencies) if latencies else 0,
+        "p95": percentile(latencies, 0.95) if latencies else 0,
+    }
+
+
+async def main():
+    import httpx
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--project-id", required=True)
+    parser.add_argument("--chat-id", required=True)
+    parser.add_argument("--token", required=True, help="Bearer token for the test user")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=32, help="requests per concurrency level")
+    args = parser.parse_args()
+
+    url = f"{args.base_url}/api/projects/{args.project_id}/chats/{args.chat_id}/messages"
+
+    print(f"{'concurrency':>11} {'ok':>5} {'errors':>6} {'req/s':>7} {'p50 s':>7} {'p95 s':>7}")
+    async with httpx.AsyncClient(headers={"Authorization": f"Bearer {args.token}"}, timeout=300) as client:
+        for concurrency in args.concurrency:
+            result = await run_level(client, url, args.requests, concurrency)
+            print(
+                f"{result['concurrency']:>11} {result['ok']:>5} {result['errors']:>6} "
+                f"{result['requests_per_second']:>7.2f} {result['p50']:>7.2f} {result['p95']:>7.2f}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+"""
+    Startup cost of the API process vs the Celery worker.
+
+    Imports each entry module in a fresh interpreter and reports wall-clock
+    import time and peak RSS, so regressions in what the API pulls in at
+    startup show up next to the worker's (expected) heavy imports.
+
+    Usage: python benchmarks/import_cost.py [--runs 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = {
+    "python": None,      # bare interpreter baseline
+    "api": "main",
+    "worker": "tasks",
+}
+
+# Placeholders so module-level clients can be constructed without real credentials
+DUMMY_ENV = {
+    "SUPABASE_API_URL": "http://localhost:54321",
+    "SUPABASE_SERVICE_KEY": "dummy.dummy.dummy",
+    "OPENAI_API_KEY": "sk-dummy",
+    "CLERK_SECRET_KEY": "sk_test_dummy",
+    "SCRAPINGBEE_API_KEY": "dummy",
+    "S3_BUCKET_NAME": "dummy",
+    "AWS_REGION": "us-east-1",
+}
+
+PROBE = """
+import json, resource, sys, time
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+{import_line}
+elapsed = time.perf_counter() - started
+print(json.dumps({{
+    "seconds": elapsed,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "modules": len(sys.modules)
+}}))
+"""
+
+
+def measure(module: str) -> dict:
+    import_line = f"import {module}" if module else "pass"
+    env = {**DUMMY_ENV, **os.environ}
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE.format(root=ROOT, import_line=import_line)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'process':<10} {'import s (median)':>18} {'peak RSS MB':>12} {'modules':>8}")
+    for name, module in MODULES.items():
+        runs = [measure(module) for _ in range(args.runs)]
+        print(
+            f"{name:<10} "
+            f"{statistics.median(run['seconds'] for run in runs):>18.3f} "
+            f"{max(run['max_rss_mb'] for run in runs):>12.1f} "
+            f"{runs[-1]['modules']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
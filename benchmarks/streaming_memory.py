@@ -0,0 +1,127 @@
+"""
+    Peak worker memory vs document length, whole-document vs streaming ingestion.
+
+    Generates text PDFs of increasing page counts and, in a fresh interpreter per
+    run, partitions + chunks each one either all at once (partition_pdf_adaptive)
+    or window by window (iter_pdf_windows). Peak RSS should grow with page count
+    for the whole-document mode and stay flat for streaming.
+
+    Summaries and embeddings need network access and are left out; they scale the
+    same way (per chunk) on top of what is measured here.
+
+    Usage: python benchmarks/streaming_memory.py [--pages 50 200 800] [--window 40]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from import_cost import DUMMY_ENV, ROOT
+
+LINES_PER_PAGE = 45
+
+PROBE = """
+import json, resource, sys, time
+sys.path.insert(0, {root!r})
+import tasks
+started = time.perf_counter()
+chunk_count = 0
+if {mode!r} == "document":
+    elements, _ = tasks.partition_pdf_adaptive({path!r})
+    chunks, _ = tasks.chunk_elements_by_title(elements)
+    chunk_count = len(chunks)
+else:
+    page_strategies = tasks.pdf_page_strategies({path!r})
+    for _, chunks, _ in tasks.iter_pdf_windows({path!r}, page_strategies, {window}):
+        chunk_count += len(chunks)
+        del chunks
+elapsed = time.perf_counter() - started
+print(json.dumps({{
+    "seconds": elapsed,
+    "chunks": chunk_count,
+    "max_rss_mb": max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    ) / 1024
+}}))
+"""
+
+
+def write_text_pdf(path: str, pages: int):
+    """ Minimal born-digital PDF: a heading and LINES_PER_PAGE lines of text per page """
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once the page objects are numbered
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+
+    for page in range(1, pages + 1):
+        lines = [f"BT /F1 18 Tf 72 760 Td (Section {page}) Tj ET"]
+        for line in range(LINES_PER_PAGE):
+            y = 730 - line * 15
+            lines.append(
+                f"BT /F1 10 Tf 72 {y} Td (Page {page} line {line}: the quick brown fox "
+                f"jumps over the lazy dog while the report discusses item {page * 100 + line}.) Tj ET"
+            )
+        stream = "\n".join(lines).encode("latin-1")
+
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids).encode("latin-1")
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % pages
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, 1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+
+        xref_offset = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset))
+
+
+def measure(mode: str, path: str, window: int) -> dict:
+    # One partitioning thread so the comparison isn't skewed by pool size
+    env = {**DUMMY_ENV, **os.environ, "PDF_PARTITION_WORKERS": "1"}
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE.format(root=ROOT, mode=mode, path=path, window=window)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, nargs="+", default=[50, 200, 800])
+    parser.add_argument("--window", type=int, default=40)
+    args = parser.parse_args()
+
+    print(f"{'pages':>6} {'mode':<10} {'chunks':>7} {'seconds':>8} {'peak RSS MB':>12}")
+    with tempfile.TemporaryDirectory() as directory:
+        for pages in args.pages:
+            path = os.path.join(directory, f"doc_{pages}.pdf")
+            write_text_pdf(path, pages)
+
+            for mode in ("document", "streaming"):
+                result = measure(mode, path, args.window)
+                print(
+                    f"{pages:>6} {mode:<10} {result['chunks']:>7} "
+                    f"{result['seconds']:>8.2f} {result['max_rss_mb']:>12.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+
+CACHE_DIR = os.getenv("CACHE_DIR", "/tmp/rag-cache")
+
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+EMBEDDING_CACHE_TTL_SECONDS = int(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+EMBEDDING_CACHE_REDIS_URL = os.getenv("EMBEDDING_CACHE_REDIS_URL")
+
+SUMMARY_CACHE_ENABLED = os.getenv("SUMMARY_CACHE_ENABLED", "true").lower() == "true"
+SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", "50000"))
+SUMMARY_CACHE_TTL_SECONDS = int(os.getenv("SUMMARY_CACHE_TTL_SECONDS", str(90 * 24 * 3600)))
+
+# How many writes between eviction sweeps of the local cache
+EVICTION_INTERVAL = 500
+
+
+def normalize_text(text: str) -> str:
+    """ Normalize text before hashing so whitespace/unicode variants share a key """
+    return " ".join(unicodedata.normalize("NFC", text or "").split())
+
+
+class LocalCache:
+    """
+        On-disk key/value cache backed by SQLite.
+        Entries expire after ttl_seconds and the least recently used entries
+        are evicted once the cache holds more than max_entries.
+    """
+
+    def __init__(self, name: str, max_entries: int, ttl_seconds: int):
+        self.path = os.path.join(CACHE_DIR, f"{name}.sqlite3")
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._writes_since_eviction = 0
+
+    def _connection(self):
+        # Connections must not cross a fork (Celery prefork / uvicorn workers)
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at_idx ON entries (accessed_at)")
+            self._conn.commit()
+            self._pid = os.getpid()
+        return self._conn
+
+    def get_many(self, keys: list) -> dict:
+        """ Return {key: value} for every key that is cached and not expired """
+        if not keys:
+            return {}
+
+        now = time.time()
+        found = {}
+
+        with self._lock:
+            conn = self._connection()
+            unique_keys = list(set(keys))
+
+            # Stay under SQLite's bound-parameter limit
+            for i in range(0, len(unique_keys), 500):
+                batch = unique_keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT key, value, created_at FROM entries WHERE key IN ({placeholders})", batch
+                ).fetchall()
+
+                for key, value, created_at in rows:
+                    if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                        conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    else:
+                        found[key] = value
+
+            # Touch hits so LRU eviction keeps them
+            conn.executemany("UPDATE entries SET accessed_at = ? WHERE key = ?", [(now, key) for key in found])
+            conn.commit()
+
+        return found
+
+    def get(self, key: str):
+        return self.get_many([key]).get(key)
+
+    def set_many(self, items: dict):
+        """ Store {key: value} pairs, evicting old entries when over capacity """
+        if not items:
+            return
+
+        now = time.time()
+
+        with self._lock:
+            conn = self._connection()
+            conn.executemany(
+                "INSERT OR REPLACE INTO entries (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                [(key, value, now, now) for key, value in items.items()]
+            )
+            conn.commit()
+
+            self._writes_since_eviction += len(items)
+            if self._writes_since_eviction >= EVICTION_INTERVAL:
+                self._evict(conn, now)
+                self._writes_since_eviction = 0
+
+    def set(self, key: str, value: bytes):
+        self.set_many({key: value})
+
+    def _evict(self, conn, now: float):
+        if self.ttl_seconds:
+            conn.execute("DELETE FROM entries WHERE created_at < ?", (now - self.ttl_seconds,))
+
+        (count,) = conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+        if count > self.max_entries:
+            conn.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY accessed_at ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+        conn.commit()
+
+
+class RedisCache:
+    """ Optional shared cache tier; failures are logged and treated as misses """
+
+    def __init__(self, url: str, prefix: str, ttl_seconds: int):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+
+    def get_many(self, keys: list) -> dict:
+        if not keys:
+            return {}
+        try:
+            values = self.client.mget([f"{self.prefix}:{key}" for key in keys])
+            return {key: value for key, value in zip(keys, values) if value is not None}
+        except Exception as e:
+            print(f"⚠️ Redis cache read failed: {e}")
+            return {}
+
+    def set_many(self, items: dict):
+        if not items:
+            return
+        try:
+            pipeline = self.client.pipeline(transaction=False)
+            for key, value in items.items():
+                if self.ttl_seconds:
+                    pipeline.setex(f"{self.prefix}:{key}", self.ttl_seconds, value)
+                else:
+                    pipeline.set(f"{self.prefix}:{key}", value)
+            pipeline.execute()
+        except Exception as e:
+            print(f"⚠️ Redis cache write failed: {e}")
+
+
+class EmbeddingCache:
+    """ Content-addressed embedding cache: local SQLite first, then Redis (if configured) """
+
+    def __init__(self, model: str, dimensions: int):
+        self.model = model
+        self.dimensions = dimensions
+        self.local = LocalCache("embeddings", EMBEDDING_CACHE_MAX_ENTRIES, EMBEDDING_CACHE_TTL_SECONDS)
+        self.redis = None
+        if EMBEDDING_CACHE_REDIS_URL:
+            self.redis = RedisCache(EMBEDDING_CACHE_REDIS_URL, "embedding", EMBEDDING_CACHE_TTL_SECONDS)
+
+        self._stats_lock = threading.Lock()
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    def key(self, text: str) -> str:
+        digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        return f"{self.model}:{self.dimensions}:{digest}"
+
+    def get_many(self, texts: list) -> list:
+        """ Cached vector (or None) for each text, in order """
+        keys = [self.key(text) for text in texts]
+        found = self.local.get_many(keys)
+        local_hits = len(found)
+
+        missing = [key for key in set(keys) if key not in found]
+        redis_found = self.redis.get_many(missing) if self.redis and missing else {}
+        if redis_found:
+            # Backfill the local tier
+            self.local.set_many(redis_found)
+            found.update(redis_found)
+
+        vectors = [
+            array("f", found[key]).tolist() if key in found else None
+            for key in keys
+        ]
+
+        with self._stats_lock:
+            self.local_hits += local_hits
+            self.redis_hits += len(redis_found)
+            self.misses += sum(1 for vector in vectors if vector is None)
+
+        return vectors
+
+    def set_many(self, texts: list, vectors: list):
+        items = {self.key(text): array("f", vector).tobytes() for text, vector in zip(texts, vectors)}
+        self.local.set_many(items)
+        if self.redis:
+            self.redis.set_many(items)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "local_hits": self.local_hits,
+                "redis_hits": self.redis_hits,
+                "misses": self.misses
+            }
+
+
+class CachedEmbeddings:
+    """ Wraps an embeddings model so embed_documents / embed_query (and their async variants) check the cache first """
+
+    def __init__(self, embeddings, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts: list) -> list:
+        vectors = self.cache.get_many(texts)
+
+        # Only send unique uncached texts to the provider
+        missing_texts = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if missing_texts:
+            new_vectors = self.embeddings.embed_documents(missing_texts)
+            self.cache.set_many(missing_texts, new_vectors)
+            by_text = dict(zip(missing_texts, new_vectors))
+            vectors = [vector if vector is not None else by_text[text] for text, vector in zip(texts, vectors)]
+
+        return vectors
+
+    def embed_query(self, text: str) -> list:
+        (vector,) = self.cache.get_many([text])
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.set_many([text], [vector])
+        return vector
+
+    async def aembed_documents(self, texts: list) -> list:
+        # Cache tiers are blocking (SQLite / Redis), keep them off the event loop
+        vectors = await asyncio.to_thread(self.cache.get_many, texts)
+
+        missing_texts = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if missing_texts:
+            new_vectors = await self.embeddings.aembed_documents(missing_texts)
+            await asyncio.to_thread(self.cache.set_many, missing_texts, new_vectors)
+            by_text = dict(zip(missing_texts, new_vectors))
+            vectors = [vector if vector is not None else by_text[text] for text, vector in zip(texts, vectors)]
+
+        return vectors
+
+    async def aembed_query(self, text: str) -> list:
+        (vector,) = await asyncio.to_thread(self.cache.get_many, [text])
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            await asyncio.to_thread(self.cache.set_many, [text], [vector])
+        return vector
+
+
+class SummaryCache:
+    """ Local cache of AI summaries keyed by a digest of everything that goes into the prompt """
+
+    def __init__(self):
+        self.local = LocalCache("summaries", SUMMARY_CACHE_MAX_ENTRIES, SUMMARY_CACHE_TTL_SECONDS)
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, prompt_version: str, model: str, text: str, tables: list, images: list) -> str:
+        """ Key for a chunk summary; images are hashed (base64 or descriptions alike) """
+        image_hashes = [hashlib.sha256(image.encode("utf-8")).hexdigest() for image in images]
+        payload = json.dumps([prompt_version, model, text, tables, image_hashes])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def image_key(self, prompt_version: str, model: str, image_sha256: str) -> str:
+        """ 
+            Key for a single image description, shared by every document containing that exact image.
+            Must be an exact content hash: a perceptual hash would hand one image's description
+            (and its text / numbers) to a different, similar-looking image from another user.
+        """
+        payload = json.dumps([prompt_version, model, "image", image_sha256])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        value = self.local.get(key) if SUMMARY_CACHE_ENABLED else None
+
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return value.decode("utf-8") if value is not None else None
+
+    def set(self, key: str, summary: str):
+        if SUMMARY_CACHE_ENABLED and summary:
+            self.local.set(key, summary.encode("utf-8"))
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+def cached_embeddings(embeddings, model: str, dimensions: int):
+    """ Return the embeddings model wrapped with the shared cache (if enabled) """
+    if not EMBEDDING_CACHE_ENABLED:
+        return embeddings
+    return CachedEmbeddings(embeddings, EmbeddingCache(model, dimensions))
@@ -0,0 +1,59 @@
+import gzip
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from database import BUCKET_NAME, s3_client
+
+CHECKPOINT_PREFIX = "checkpoints"
+CHECKPOINT_DELETE_CONCURRENCY = int(os.getenv("CHECKPOINT_DELETE_CONCURRENCY", "8"))
+
+
+def checkpoint_key(document_id: str, name: str) -> str:
+    return f"{CHECKPOINT_PREFIX}/{document_id}/{name}.json.gz"
+
+
+def save_checkpoint(document_id: str, name: str, data):
+    """ Persist a stage artifact (any JSON-serializable value) as gzipped JSON in S3 """
+    body = gzip.compress(json.dumps(data).encode("utf-8"))
+    s3_client.put_object(
+        Bucket=BUCKET_NAME,
+        Key=checkpoint_key(document_id, name),
+        Body=body,
+        ContentType="application/json",
+        ContentEncoding="gzip"
+    )
+    print(f"💾 Saved {name} checkpoint for {document_id} ({len(body)} bytes)")
+
+
+def load_checkpoint(document_id: str, name: str):
+    """ Load a stage artifact, or None if the stage has not completed yet """
+    try:
+        response = s3_client.get_object(Bucket=BUCKET_NAME, Key=checkpoint_key(document_id, name))
+    except s3_client.exceptions.NoSuchKey:
+        return None
+
+    return json.loads(gzip.decompress(response["Body"].read()).decode("utf-8"))
+
+
+def has_checkpoint(document_id: str, name: str) -> bool:
+    try:
+        s3_client.head_object(Bucket=BUCKET_NAME, Key=checkpoint_key(document_id, name))
+        return True
+    except s3_client.exceptions.ClientError:
+        return False
+
+
+def delete_checkpoints(document_id: str):
+    """ Remove all stage artifacts, once the document is fully stored or when it is deleted """
+    response = s3_client.list_objects_v2(Bucket=BUCKET_NAME, Prefix=f"{CHECKPOINT_PREFIX}/{document_id}/")
+    keys = [{"Key": item["Key"]} for item in response.get("Contents", [])]
+
+    if keys:
+        s3_client.delete_objects(Bucket=BUCKET_NAME, Delete={"Objects": keys})
+
+
+def delete_checkpoints_for_documents(document_ids: list):
+    """ delete_checkpoints for many documents (e.g. a whole project), a few at a time """
+    with ThreadPoolExecutor(max_workers=CHECKPOINT_DELETE_CONCURRENCY) as executor:
+        list(executor.map(delete_checkpoints, document_ids))
@@ -0,0 +1,282 @@
+import asyncio
+import ipaddress
+import os
+import socket
+import time
+import xml.etree.ElementTree as ET
+from collections import deque
+from html.parser import HTMLParser
+from urllib.parse import parse_qsl, urldefrag, urlencode, urljoin, urlsplit, urlunsplit
+from urllib.robotparser import RobotFileParser
+
+# Crawl limits and politeness
+CRAWL_MAX_DEPTH = int(os.getenv("CRAWL_MAX_DEPTH", "2"))
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "100"))
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "8"))  # fetches in flight across all hosts
+CRAWL_PER_HOST_CONCURRENCY = int(os.getenv("CRAWL_PER_HOST_CONCURRENCY", "2"))
+CRAWL_HOST_DELAY_SECONDS = float(os.getenv("CRAWL_HOST_DELAY_SECONDS", "1.0"))  # min gap between requests to one host
+CRAWL_TIMEOUT = float(os.getenv("CRAWL_TIMEOUT", "30"))
+CRAWL_USER_AGENT = os.getenv("CRAWL_USER_AGENT", "SixFigureRAGBot/1.0")
+CRAWL_MAX_REDIRECTS = int(os.getenv("CRAWL_MAX_REDIRECTS", "5"))
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+TRACKING_PARAMS = ("utm_", "fbclid", "gclid")
+
+
+def normalize_url(url: str, base: str = None):
+    """ Canonical form used for dedup: absolute, no fragment, lower-case host, no default port, sorted query """
+    if base:
+        url = urljoin(base, url)
+    url, _ = urldefrag(url.strip())
+
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.hostname:
+        return None
+
+    host = parts.hostname.lower()
+    if parts.port and parts.port != DEFAULT_PORTS[scheme]:
+        host = f"{host}:{parts.port}"
+
+    query = urlencode(sorted(
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not name.startswith(TRACKING_PARAMS)
+    ))
+
+    return urlunsplit((scheme, host, parts.path or "/", query, ""))
+
+
+class BlockedURLError(Exception):
+    """ URL points at (or redirects to) an address the crawler must not reach """
+
+
+def is_public_address(address: str) -> bool:
+    """ False for private, loopback, link-local, reserved, multicast and unspecified addresses """
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+async def ensure_public_url(url: str):
+    """ Resolve the URL's host and refuse it unless every address it resolves to is public """
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.hostname:
+        raise BlockedURLError(f"Unsupported URL: {url}")
+
+    try:
+        addresses = await asyncio.get_running_loop().getaddrinfo(
+            parts.hostname, parts.port or DEFAULT_PORTS[scheme], type=socket.SOCK_STREAM
+        )
+    except socket.gaierror as e:
+        raise BlockedURLError(f"Cannot resolve {parts.hostname}") from e
+
+    blocked = sorted({sockaddr[0] for *_, sockaddr in addresses if not is_public_address(sockaddr[0])})
+    if not addresses or blocked:
+        raise BlockedURLError(f"{parts.hostname} resolves to a non-public address: {', '.join(blocked)}")
+
+
+class Frontier:
+    """ FIFO of (url, depth) that only ever admits a normalized URL once """
+
+    def __init__(self, seen: set = None):
+        self.seen = set(seen or ())
+        self.queue = deque()
+
+    def add(self, url: str, depth: int) -> bool:
+        url = normalize_url(url)
+        if not url or url in self.seen:
+            return False
+        self.seen.add(url)
+        self.queue.append((url, depth))
+        return True
+
+    def pop(self):
+        return self.queue.popleft() if self.queue else None
+
+
+class LinkExtractor(HTMLParser):
+    """ Collects <a href> targets from an HTML page """
+
+    def __init__(self):
+        super().__init__()
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            href = dict(attrs).get("href")
+            if href and not href.startswith(("mailto:", "javascript:", "tel:")):
+                self.links.append(href)
+
+
+def extract_links(html: str, base_url: str) -> list:
+    parser = LinkExtractor()
+    try:
+        parser.feed(html)
+    except Exception as e:
+        print(f"⚠️ Failed to parse links from {base_url}: {e}")
+    return [link for link in (normalize_url(href, base_url) for href in parser.links) if link]
+
+
+def parse_sitemap(content: bytes):
+    """ Returns (page_urls, nested_sitemap_urls) from a sitemap or sitemap index """
+    root = ET.fromstring(content)
+    namespace = root.tag.split("}")[0] + "}" if root.tag.startswith("{") else ""
+    locations = [loc.text.strip() for loc in root.iter(f"{namespace}loc") if loc.text]
+
+    if root.tag.endswith("sitemapindex"):
+        return [], locations
+    return locations, []
+
+
+class SiteCrawler:
+    """
+        Async crawler: starts from a seed URL and/or sitemap, follows links within
+        the allowed domains up to max_depth / max_pages, and hands every HTML page
+        to on_page(url, content) as soon as it is fetched.
+    """
+
+    def __init__(self, on_page, seed_url: str = None, sitemap_url: str = None,
+                 max_depth: int = CRAWL_MAX_DEPTH, max_pages: int = CRAWL_MAX_PAGES,
+                 allowed_domains: list = None, seen_urls: set = None):
+        self.on_page = on_page
+        self.seed_url = seed_url
+        self.sitemap_url = sitemap_url
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+
+        seeds = [url for url in (seed_url, sitemap_url) if url]
+        self.allowed_domains = {
+            domain.lower() for domain in (allowed_domains or [urlsplit(url).hostname for url in seeds])
+        }
+
+        self.frontier = Frontier({normalize_url(url) for url in (seen_urls or ())})
+        self.pages_crawled = 0
+        self.errors = 0
+
+        self._host_semaphores = {}
+        self._host_next_request = {}
+        self._host_locks = {}
+        self._robots = {}
+
+    def is_allowed_domain(self, url: str) -> bool:
+        host = urlsplit(url).hostname or ""
+        return any(host == domain or host.endswith(f".{domain}") for domain in self.allowed_domains)
+
+    async def _polite(self, host: str):
+        """ Wait for this host's next request slot """
+        lock = self._host_locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            wait = self._host_next_request.get(host, 0) - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._host_next_request[host] = time.monotonic() + CRAWL_HOST_DELAY_SECONDS
+
+    async def _robots_allows(self, client, url: str) -> bool:
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+
+        if origin not in self._robots:
+            robots = RobotFileParser()
+            try:
+                response = await self._get(client, f"{origin}/robots.txt")
+                robots.parse(response.text.splitlines() if response.status_code == 200 else [])
+            except Exception:
+                robots.parse([])
+            self._robots[origin] = robots
+
+        return self._robots[origin].can_fetch(CRAWL_USER_AGENT, url)
+
+    async def _get(self, client, url: str):
+        """ GET that follows redirects itself, checking every hop resolves to a public address """
+        for _ in range(CRAWL_MAX_REDIRECTS + 1):
+            await ensure_public_url(url)
+            response = await client.get(url)
+            if not response.is_redirect:
+                return response
+            url = urljoin(str(response.url), response.headers["location"])
+
+        raise BlockedURLError(f"Too many redirects: {url}")
+
+    async def fetch(self, client, url: str):
+        host = urlsplit(url).netloc
+        semaphore = self._host_semaphores.setdefault(host, asyncio.Semaphore(CRAWL_PER_HOST_CONCURRENCY))
+
+        async with semaphore:
+            await self._polite(host)
+            return await self._get(client, url)
+
+    async def _load_sitemap(self, client, sitemap_url: str):
+        pending = [sitemap_url]
+        while pending and len(self.frontier.queue) < self.max_pages:
+            response = await self.fetch(client, pending.pop(0))
+            if response.status_code != 200:
+                continue
+            page_urls, nested = parse_sitemap(response.content)
+            pending.extend(nested)
+            for url in page_urls:
+                if self.is_allowed_domain(url):
+                    self.frontier.add(url, 0)
+
+    async def _worker(self, client, queue: asyncio.Queue):
+        while True:
+            url, depth = await queue.get()
+            try:
+                if self.pages_crawled >= self.max_pages or not await self._robots_allows(client, url):
+                    continue
+
+                response = await self.fetch(client, url)
+                content_type = response.headers.get("content-type", "")
+                if response.status_code != 200 or "html" not in content_type:
+                    continue
+
+                self.pages_crawled += 1
+                if self.pages_crawled > self.max_pages:
+                    continue
+
+                # Hand the page off right away, partitioning starts while we keep crawling
+                await self.on_page(str(response.url), response.content)
+
+                if depth < self.max_depth:
+                    for link in extract_links(response.text, str(response.url)):
+                        if self.is_allowed_domain(link) and self.frontier.add(link, depth + 1):
+                            queue.put_nowait(self.frontier.pop())
+
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠️ Crawl failed for {url}: {e}")
+            finally:
+                queue.task_done()
+
+    async def run(self) -> dict:
+        import httpx
+
+        async with httpx.AsyncClient(
+            headers={"User-Agent": CRAWL_USER_AGENT},
+            timeout=CRAWL_TIMEOUT,
+            follow_redirects=False  # redirects go through _get so every hop is checked
+        ) as client:
+            if self.sitemap_url:
+                await self._load_sitemap(client, self.sitemap_url)
+            if self.seed_url:
+                self.frontier.add(self.seed_url, 0)
+
+            queue = asyncio.Queue()
+            while self.frontier.queue:
+                queue.put_nowait(self.frontier.pop())
+
+            workers = [asyncio.create_task(self._worker(client, queue)) for _ in range(CRAWL_CONCURRENCY)]
+            await queue.join()
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        return {
+            "pages_crawled": min(self.pages_crawled, self.max_pages),
+            "urls_discovered": len(self.frontier.seen),
+            "errors": self.errors
+        }
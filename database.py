@@ -1,6 +1,6 @@
 import os
 from dotenv import load_dotenv
-from supabase import create_client, Client
+from supabase import acreate_client, create_client, AsyncClient, Client
 import boto3
 
 load_dotenv()
@@ -14,6 +14,17 @@ if not supabase_url or not supabase_key:
 
 supabase: Client = create_client(supabase_url, supabase_key)
 
+# Async client for request handlers that must not block the event loop (built on first use, inside the loop)
+_async_supabase: AsyncClient = None
+
+
+async def get_async_supabase() -> AsyncClient:
+    global _async_supabase
+
+    if _async_supabase is None:
+        _async_supabase = await acreate_client(supabase_url, supabase_key)
+    return _async_supabase
+
 
 # S3 Setup
 s3_client = boto3.client(
@@ -0,0 +1,48 @@
+import os
+
+# Shared by the API (which only enqueues) and the worker (tasks.py).
+# Keep this module light: the API must not import tasks.py, which pulls in
+# unstructured, langchain and the model clients.
+
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
+CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
+
+# CPU-heavy partitioning/chunking and IO-bound LLM/embedding stages run on separate worker pools, e.g.
+#   celery -A tasks worker -Q celery,ingest-cpu --concurrency=2
+#   celery -A tasks worker -Q ingest-io --pool=threads --concurrency=16
+INGEST_CPU_QUEUE = os.getenv("INGEST_CPU_QUEUE", "ingest-cpu")
+INGEST_IO_QUEUE = os.getenv("INGEST_IO_QUEUE", "ingest-io")
+
+TASK_ROUTES = {
+    "tasks.partition_stage": {"queue": INGEST_CPU_QUEUE},
+    "tasks.chunk_stage": {"queue": INGEST_CPU_QUEUE},
+    "tasks.stream_document": {"queue": INGEST_CPU_QUEUE},
+    "tasks.summarise_stage": {"queue": INGEST_IO_QUEUE},
+    "tasks.store_stage": {"queue": INGEST_IO_QUEUE},
+    "tasks.refresh_url_document": {"queue": INGEST_IO_QUEUE},
+    "tasks.crawl_website": {"queue": INGEST_IO_QUEUE},
+}
+
+_celery_client = None
+
+
+def get_celery_client():
+    """ Celery app used only to send tasks by name, created on first use """
+    global _celery_client
+
+    if _celery_client is None:
+        from celery import Celery
+
+        _celery_client = Celery(
+            'document_processor',
+            broker=CELERY_BROKER_URL,
+            backend=CELERY_RESULT_BACKEND
+        )
+        _celery_client.conf.task_routes = TASK_ROUTES
+
+    return _celery_client
+
+
+def enqueue(task_name: str, *args, **kwargs):
+    """ Enqueue a tasks.py task by name, returns the AsyncResult """
+    return get_celery_client().send_task(f"tasks.{task_name}", args=args, kwargs=kwargs)
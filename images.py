@@ -0,0 +1,330 @@
+import base64
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from database import BUCKET_NAME, s3_client, supabase
+
+# Image normalization applied before summarisation and storage
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "1024"))  # longest side after downscaling
+IMAGE_MIN_EDGE = int(os.getenv("IMAGE_MIN_EDGE", "32"))  # images with a shorter side are dropped
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "JPEG").upper()  # JPEG or WEBP
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "75"))
+
+
+def image_mime_type(image_base64: str) -> str:
+    """ Sniff the mime type of a base64 image from its magic bytes """
+    if image_base64.startswith("UklGR"):
+        return "image/webp"
+    if image_base64.startswith("iVBORw0KGgo"):
+        return "image/png"
+    if image_base64.startswith("R0lGOD"):
+        return "image/gif"
+    return "image/jpeg"
+
+
+def image_data_url(image_base64: str) -> str:
+    """ Build a data URL for the LLM, stripping any existing data URI prefix """
+    if image_base64.startswith("data:image"):
+        image_base64 = image_base64.split(",", 1)[1]
+    return f"data:{image_mime_type(image_base64)};base64,{image_base64}"
+
+
+def normalize_image(image_base64: str):
+    """ Downscale to IMAGE_MAX_EDGE and re-encode, returns the new base64 or None if too small to be useful """
+    from PIL import Image
+
+    raw = base64.b64decode(image_base64)
+    image = Image.open(io.BytesIO(raw))
+
+    if min(image.size) < IMAGE_MIN_EDGE:
+        return None
+
+    needs_resize = max(image.size) > IMAGE_MAX_EDGE
+    if needs_resize:
+        image.thumbnail((IMAGE_MAX_EDGE, IMAGE_MAX_EDGE), Image.LANCZOS)
+
+    # JPEG has no alpha channel, flatten transparent images onto white
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        image = background
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+
+    output = io.BytesIO()
+    image.save(output, format=IMAGE_FORMAT, quality=IMAGE_QUALITY, optimize=True)
+    encoded = output.getvalue()
+
+    # Already small and compact: keep the original bytes
+    if not needs_resize and len(encoded) >= len(raw):
+        return image_base64
+
+    return base64.b64encode(encoded).decode("ascii")
+
+
+def normalize_images(images_base64: list):
+    """ Normalize a list of base64 images, returns (images, stats) """
+    stats = {"images_in": len(images_base64), "images_dropped": 0, "bytes_in": 0, "bytes_out": 0}
+    normalized = []
+
+    for image_base64 in images_base64:
+        # base64 length is what we actually ship to the LLM and store
+        stats["bytes_in"] += len(image_base64)
+
+        try:
+            result = normalize_image(image_base64)
+        except Exception as e:
+            print(f"⚠️ Image normalization failed, keeping original: {e}")
+            result = image_base64
+
+        if result is None:
+            stats["images_dropped"] += 1
+            continue
+
+        stats["bytes_out"] += len(result)
+        normalized.append(result)
+
+    return normalized, stats
+
+
+# Perceptual-hash deduplication of repeated images (logos, banners, footers)
+IMAGE_DUPLICATE_MAX_DISTANCE = int(os.getenv("IMAGE_DUPLICATE_MAX_DISTANCE", "6"))  # differing bits out of 64
+IMAGE_BOILERPLATE_MIN_CHUNKS = int(os.getenv("IMAGE_BOILERPLATE_MIN_CHUNKS", "3"))
+IMAGE_BOILERPLATE_RATIO = float(os.getenv("IMAGE_BOILERPLATE_RATIO", "0.3"))  # share of chunks an image must appear in
+
+
+def perceptual_hash(image_base64: str) -> int:
+    """ 64-bit difference hash (dHash): robust to rescaling and re-encoding """
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(base64.b64decode(image_base64)))
+    pixels = list(image.convert("L").resize((9, 8), Image.LANCZOS).getdata())
+
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def image_content_hash(image_base64: str) -> str:
+    """ SHA-256 of the (normalized) image bytes """
+    return hashlib.sha256(base64.b64decode(image_base64)).hexdigest()
+
+
+class ImageCatalog:
+    """
+        Collapses near-duplicate images of a document to one canonical copy and
+        flags boilerplate images that recur across many chunks
+    """
+
+    def __init__(self):
+        self.clusters = []  # [{"hash", "image", "chunks"}]
+        self.images_seen = 0
+
+    def add(self, image_base64: str, chunk_index: int) -> int:
+        """ Register an image occurrence, returns its cluster id """
+        self.images_seen += 1
+
+        try:
+            image_hash = perceptual_hash(image_base64)
+        except Exception as e:
+            print(f"⚠️ Perceptual hash failed, treating image as unique: {e}")
+            image_hash = None
+
+        if image_hash is not None:
+            for cluster_id, cluster in enumerate(self.clusters):
+                if cluster["hash"] is not None and hamming_distance(cluster["hash"], image_hash) <= IMAGE_DUPLICATE_MAX_DISTANCE:
+                    cluster["chunks"].add(chunk_index)
+                    return cluster_id
+
+        self.clusters.append({"hash": image_hash, "image": image_base64, "chunks": {chunk_index}})
+        return len(self.clusters) - 1
+
+    def canonical(self, cluster_id: int) -> str:
+        return self.clusters[cluster_id]["image"]
+
+    def content_hash(self, cluster_id: int) -> str:
+        """ Exact identity of the canonical image; the perceptual hash is only for grouping within this document """
+        return image_content_hash(self.clusters[cluster_id]["image"])
+
+    def boilerplate_ids(self, total_chunks: int) -> set:
+        """ Clusters that appear in too many chunks to be worth summarising """
+        threshold = max(IMAGE_BOILERPLATE_MIN_CHUNKS, IMAGE_BOILERPLATE_RATIO * total_chunks)
+        return {
+            cluster_id for cluster_id, cluster in enumerate(self.clusters)
+            if len(cluster["chunks"]) >= threshold
+        }
+
+
+# Out-of-row image storage: content-addressed S3 objects, chunks only keep references
+IMAGE_PREFIX = "images"
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+IMAGE_FETCH_CONCURRENCY = int(os.getenv("IMAGE_FETCH_CONCURRENCY", "8"))
+S3_DELETE_BATCH = 1000  # delete_objects limit per call
+
+IMAGE_EXTENSIONS = {
+    "image/jpeg": "jpg",
+    "image/webp": "webp",
+    "image/png": "png",
+    "image/gif": "gif"
+}
+
+
+def image_object_key(image_base64: str) -> str:
+    """ S3 key an image is stored under: images/<sha256 of bytes>.<ext> """
+    mime_type = image_mime_type(image_base64)
+    return f"{IMAGE_PREFIX}/{image_content_hash(image_base64)}.{IMAGE_EXTENSIONS[mime_type]}"
+
+
+def store_image(image_base64: str) -> dict:
+    """ Upload an image under its SHA-256 (once) and return the reference kept in original_content """
+    from PIL import Image
+
+    raw = base64.b64decode(image_base64)
+    mime_type = image_mime_type(image_base64)
+    key = image_object_key(image_base64)
+    width, height = Image.open(io.BytesIO(raw)).size
+
+    try:
+        s3_client.head_object(Bucket=BUCKET_NAME, Key=key)
+    except s3_client.exceptions.ClientError:
+        s3_client.put_object(Bucket=BUCKET_NAME, Key=key, Body=raw, ContentType=mime_type)
+
+    return {
+        "key": key,
+        "mime_type": mime_type,
+        "width": width,
+        "height": height,
+        "bytes": len(raw)
+    }
+
+
+def image_url(image_ref, expires_in: int = 3600) -> str:
+    """ Presigned GET URL for a stored image reference """
+    return s3_client.generate_presigned_url(
+        'get_object',
+        Params={'Bucket': BUCKET_NAME, 'Key': image_ref["key"]},
+        ExpiresIn=expires_in
+    )
+
+
+class ImageByteCache:
+    """ Thread-safe LRU cache of base64 images, bounded by total size """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str):
+        if len(value) > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._items:
+                self.size -= len(self._items.pop(key))
+            self._items[key] = value
+            self.size += len(value)
+
+            while self.size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= len(evicted)
+
+
+image_cache = ImageByteCache(IMAGE_CACHE_MAX_BYTES)
+
+
+def fetch_image(image_ref):
+    """ Base64 image for a reference; older chunks still hold the base64 inline """
+    if isinstance(image_ref, str):
+        return image_ref
+
+    key = image_ref["key"]
+    cached = image_cache.get(key)
+    if cached is not None:
+        return cached
+
+    raw = s3_client.get_object(Bucket=BUCKET_NAME, Key=key)["Body"].read()
+    image_base64 = base64.b64encode(raw).decode("ascii")
+    image_cache.set(key, image_base64)
+    return image_base64
+
+
+def fetch_images(image_refs: list) -> list:
+    """ Fetch images concurrently (through the LRU cache), keeping order and skipping failures """
+    if not image_refs:
+        return []
+
+    def fetch(image_ref):
+        try:
+            return fetch_image(image_ref)
+        except Exception as e:
+            print(f"⚠️ Failed to fetch image {image_ref.get('key') if isinstance(image_ref, dict) else ''}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=min(IMAGE_FETCH_CONCURRENCY, len(image_refs))) as executor:
+        images = list(executor.map(fetch, image_refs))
+
+    return [image for image in images if image is not None]
+
+
+def record_image_references(document_id: str, image_keys) -> None:
+    """ Mark the image objects a document's chunks point at, before they are uploaded """
+    rows = [{"document_id": document_id, "image_key": key} for key in sorted(set(image_keys))]
+    if rows:
+        supabase.table("document_images").upsert(rows, on_conflict="document_id,image_key").execute()
+
+
+def document_image_keys(document_id: str) -> list:
+    """ Image objects a single document references """
+    result = supabase.table("document_images").select("image_key").eq("document_id", document_id).execute()
+    return [row["image_key"] for row in result.data or []]
+
+
+def project_image_keys(project_id: str) -> list:
+    """ Image objects referenced by any document of a project """
+    result = supabase.rpc("project_image_keys", {"p_project_id": project_id}).execute()
+    return list(result.data or [])
+
+
+def delete_unreferenced_images(image_keys) -> int:
+    """
+        Delete the given image objects that no document references any more.
+        Call after the referencing documents are gone (their document_images rows
+        cascade); keys still used by another document are left alone.
+    """
+    image_keys = sorted(set(image_keys))
+    if not image_keys:
+        return 0
+
+    result = supabase.rpc("unreferenced_image_keys", {"p_image_keys": image_keys}).execute()
+    orphaned = list(result.data or [])
+
+    for start in range(0, len(orphaned), S3_DELETE_BATCH):
+        batch = orphaned[start:start + S3_DELETE_BATCH]
+        s3_client.delete_objects(
+            Bucket=BUCKET_NAME,
+            Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True}
+        )
+
+    return len(orphaned)
@@ -0,0 +1,77 @@
+import os
+
+# Pre-scan thresholds used to route each PDF page to a partitioning strategy
+PDF_SCANNED_MAX_CHARS = int(os.getenv("PDF_SCANNED_MAX_CHARS", "20"))  # fewer text chars than this ...
+PDF_SCANNED_MIN_IMAGE_COVERAGE = float(os.getenv("PDF_SCANNED_MIN_IMAGE_COVERAGE", "0.6"))  # ... and images covering this share of the page = scanned
+PDF_TABLE_MIN_LINES = int(os.getenv("PDF_TABLE_MIN_LINES", "8"))  # ruling lines/rects that suggest a table
+
+
+def classify_page(chars: int, images: int, lines: int, image_coverage: float) -> str:
+    """
+        'scanned' only when the page is essentially one big picture with no text layer:
+        ocr_only keeps the text but drops Image elements, so a figure or photo with a short
+        caption must stay 'visual' (hi_res) to keep its images.
+    """
+    if chars < PDF_SCANNED_MAX_CHARS and image_coverage >= PDF_SCANNED_MIN_IMAGE_COVERAGE:
+        return "scanned"
+    if images or lines >= PDF_TABLE_MIN_LINES:
+        return "visual"
+    return "text"
+
+
+def image_coverage(image_boxes: list, page_box: tuple) -> float:
+    """ Share of the page area covered by the (x0, y0, x1, y1) image boxes, clipped to the page """
+    page_x0, page_y0, page_x1, page_y1 = page_box
+    page_area = (page_x1 - page_x0) * (page_y1 - page_y0)
+    if page_area <= 0:
+        return 0.0
+
+    covered = 0.0
+    for x0, y0, x1, y1 in image_boxes:
+        width = min(x1, page_x1) - max(x0, page_x0)
+        height = min(y1, page_y1) - max(y0, page_y0)
+        if width > 0 and height > 0:
+            covered += width * height
+
+    return min(covered / page_area, 1.0)
+
+
+def classify_pdf_pages(temp_file: str) -> list:
+    """ Cheap pre-scan of the PDF content streams: one of 'text', 'visual' or 'scanned' per page """
+    from pdfminer.converter import PDFPageAggregator
+    from pdfminer.layout import LTChar, LTCurve, LTFigure, LTImage, LTLine, LTRect
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
+
+    resource_manager = PDFResourceManager()
+    # laparams=None skips layout analysis, we only need raw object counts
+    device = PDFPageAggregator(resource_manager, laparams=None)
+    interpreter = PDFPageInterpreter(resource_manager, device)
+
+    page_classes = []
+
+    with open(temp_file, "rb") as f:
+        for page in PDFPage.get_pages(f):
+            interpreter.process_page(page)
+
+            counts = {"chars": 0, "images": 0, "lines": 0}
+            image_boxes = []
+            stack = list(device.get_result())
+            while stack:
+                item = stack.pop()
+                if isinstance(item, LTChar):
+                    counts["chars"] += 1
+                elif isinstance(item, LTImage):
+                    counts["images"] += 1
+                    image_boxes.append(item.bbox)
+                elif isinstance(item, (LTRect, LTLine, LTCurve)):
+                    counts["lines"] += 1
+                elif isinstance(item, LTFigure):
+                    stack.extend(item)
+
+            page_classes.append(classify_page(
+                counts["chars"], counts["images"], counts["lines"],
+                image_coverage(image_boxes, tuple(page.mediabox))
+            ))
+
+    return page_classes
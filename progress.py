@@ -0,0 +1,84 @@
+import os
+import threading
+import time
+
+from database import supabase
+
+# Throttling for in-stage progress writes (stage transitions and failures always write)
+PROGRESS_MIN_INTERVAL_SECONDS = float(os.getenv("PROGRESS_MIN_INTERVAL_SECONDS", "2"))
+PROGRESS_MIN_PERCENT_CHANGE = float(os.getenv("PROGRESS_MIN_PERCENT_CHANGE", "5"))
+
+
+def update_status(document_id: str, status: str, details: dict = None):
+    """ Update document processing status, merging details into processing_details server-side """
+    supabase.rpc("update_document_progress", {
+        "p_document_id": document_id,
+        "p_status": status,
+        "p_details": details or {}
+    }).execute()
+
+
+class ProgressReporter:
+    """
+        Keeps a document's processing details in memory and coalesces writes.
+        Stage transitions, failures and explicit flushes are written straight away;
+        in-stage progress is written at most every PROGRESS_MIN_INTERVAL_SECONDS
+        and only once it has moved by PROGRESS_MIN_PERCENT_CHANGE.
+    """
+
+    def __init__(self, document_id: str, status: str = None):
+        self.document_id = document_id
+        self.status = status
+        self.details = {}
+        self._pending_details = {}
+        self._dirty = False
+        self._last_write_at = 0.0
+        self._last_written_percent = None
+        self._lock = threading.Lock()
+
+    def report(self, status: str, details: dict = None, progress: float = None, force: bool = False):
+        """ Record a status/details update; progress is the fraction (0-1) of the current stage done """
+        with self._lock:
+            stage_changed = status != self.status
+            self.status = status
+            self._dirty = True
+
+            if details:
+                self.details.update(details)
+                self._pending_details.update(details)
+
+            if force or stage_changed or progress is None or self._progress_due(progress):
+                self._write(progress)
+
+    def _progress_due(self, progress: float) -> bool:
+        percent = progress * 100
+
+        if percent >= 100:
+            return True
+        if time.monotonic() - self._last_write_at < PROGRESS_MIN_INTERVAL_SECONDS:
+            return False
+        if self._last_written_percent is None:
+            return True
+        return percent - self._last_written_percent >= PROGRESS_MIN_PERCENT_CHANGE
+
+    def _write(self, progress: float = None):
+        update_status(self.document_id, self.status, self._pending_details)
+        self._pending_details = {}
+        self._dirty = False
+        self._last_write_at = time.monotonic()
+        self._last_written_percent = progress * 100 if progress is not None else None
+
+    def flush(self):
+        """ Write anything still held back by throttling """
+        with self._lock:
+            if self._dirty and self.status:
+                self._write()
+
+    def fail(self, error: Exception):
+        """ Mark the document failed, always written """
+        self.report("failed", {
+            "error": {
+                "stage": self.status,
+                "message": str(error)
+            }
+        }, force=True)
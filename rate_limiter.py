@@ -0,0 +1,67 @@
+import threading
+import time
+from collections import deque
+
+
+def estimate_tokens(text: str) -> int:
+    """ Rough token estimate for OpenAI models (~4 characters per token) """
+    return max(1, len(text or "") // 4)
+
+
+class RateLimiter:
+    """
+        Sliding-window limiter for requests-per-minute and tokens-per-minute.
+        Thread safe: worker threads call acquire() before each provider request
+        and block until the request fits inside the last 60 seconds of budget.
+    """
+
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0, window_seconds: float = 60.0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.window_seconds = window_seconds
+        self._events = deque()  # (timestamp, tokens)
+        self._tokens_in_window = 0
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float):
+        while self._events and now - self._events[0][0] >= self.window_seconds:
+            _, tokens = self._events.popleft()
+            self._tokens_in_window -= tokens
+
+    def _wait_time(self, now: float, tokens: int) -> float:
+        """ Seconds until a request of this size fits, 0 if it fits now """
+        wait = 0.0
+
+        if self.requests_per_minute and len(self._events) >= self.requests_per_minute:
+            oldest = self._events[len(self._events) - self.requests_per_minute][0]
+            wait = max(wait, oldest + self.window_seconds - now)
+
+        if self.tokens_per_minute and self._events:
+            overflow = self._tokens_in_window + tokens - self.tokens_per_minute
+            if overflow > 0 and tokens >= self.tokens_per_minute:
+                # A single request bigger than the whole budget waits for an empty window and goes alone
+                wait = max(wait, self._events[-1][0] + self.window_seconds - now)
+            elif overflow > 0:
+                freed = 0
+                for timestamp, event_tokens in self._events:
+                    freed += event_tokens
+                    if freed >= overflow:
+                        wait = max(wait, timestamp + self.window_seconds - now)
+                        break
+
+        return wait
+
+    def acquire(self, tokens: int = 1):
+        """ Block until the request fits in the window, then record it """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._expire(now)
+                wait = self._wait_time(now, tokens)
+
+                if wait <= 0:
+                    self._events.append((now, tokens))
+                    self._tokens_in_window += tokens
+                    return
+
+            time.sleep(min(wait, self.window_seconds))
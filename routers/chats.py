@@ -1,21 +1,35 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from database import supabase
+from database import supabase, get_async_supabase
 from auth import get_current_user
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from typing import List, Dict, Tuple
+import asyncio
+import json
+import os
+import time
+from cache import cached_embeddings
+from images import fetch_images, image_data_url
 
 
 # Initialize LLM for summarization
 llm = ChatOpenAI(model="gpt-4o", temperature=0)
 
-# Initialize embeddings model
-embeddings_model = OpenAIEmbeddings(
+# Initialize embeddings model (checks the shared embedding cache first)
+embeddings_model = cached_embeddings(
+    OpenAIEmbeddings(
+        model="text-embedding-3-large",
+        dimensions=1536
+    ),
     model="text-embedding-3-large",
     dimensions=1536
 )
 
+# Multi-query retrieval: rewrites come from a small, fast model so they add little latency
+query_rewrite_llm = ChatOpenAI(model=os.getenv("QUERY_REWRITE_MODEL", "gpt-4o-mini"), temperature=0.3)
+
 router = APIRouter(
     tags=["chats"]
 )  
@@ -95,10 +109,11 @@ async def get_chat(
         raise HTTPException(status_code=500, detail=f"Failed to get chat: {str(e)}")
 
 
-def load_project_settings(project_id: str) -> dict:
+async def load_project_settings(project_id: str) -> dict:
     """Load project settings from database"""
     print(f"⚙️ Fetching project settings...")
-    settings_result = supabase.table('project_settings').select('*').eq('project_id', project_id).execute()
+    db = await get_async_supabase()
+    settings_result = await db.table('project_settings').select('*').eq('project_id', project_id).execute()
     
     if not settings_result.data:
         raise HTTPException(status_code=404, detail="Project settings not found")
@@ -107,22 +122,41 @@ def load_project_settings(project_id: str) -> dict:
     print(f"✅ Settings retrieved")
     return settings
 
-def get_document_ids(project_id: str) -> List[str]:
-    """Get all document IDs for a project"""
-    print(f"📄 Fetching project documents...")
-    documents_result = supabase.table('project_documents').select('id').eq('project_id', project_id).execute()
+async def vector_search(query_embedding: List[float], project_id: str, settings: dict) -> List[Dict]:
+    """Execute vector search over the project's chunks (slim rows with filename, no embeddings)"""
+    db = await get_async_supabase()
+    result = await db.rpc('vector_search_project_chunks', {
+        'query_embedding': query_embedding,
+        'filter_project_id': project_id,
+        'match_threshold': settings['similarity_threshold'],
+        'chunks_per_search': settings['chunks_per_search']
+    }).execute()
     
-    document_ids = [doc['id'] for doc in documents_result.data]
-    print(f"✅ Found {len(document_ids)} documents")
-    return document_ids
+    return result.data if result.data else []
 
-def vector_search(query: str, document_ids: List[str], settings: dict) -> List[Dict]:
-    """Execute vector search"""
-    query_embedding = embeddings_model.embed_query(query)
-    
-    result = supabase.rpc('vector_search_document_chunks', {
+
+async def hybrid_search(query: str, query_embedding: List[float], project_id: str, settings: dict) -> List[Dict]:
+    """Execute vector + keyword search fused with weighted reciprocal rank fusion (one RPC)"""
+    db = await get_async_supabase()
+    result = await db.rpc('hybrid_search_project_chunks', {
+        'query_text': query,
         'query_embedding': query_embedding,
-        'filter_document_ids': document_ids,
+        'filter_project_id': project_id,
+        'match_threshold': settings['similarity_threshold'],
+        'chunks_per_search': settings['chunks_per_search'],
+        'vector_weight': settings['vector_weight'],
+        'keyword_weight': settings['keyword_weight']
+    }).execute()
+    
+    return result.data if result.data else []
+
+
+async def multi_query_search(query_embeddings: List[List[float]], project_id: str, settings: dict) -> List[Dict]:
+    """Execute one vector search per query embedding, fused with reciprocal rank fusion and deduplicated (one RPC)"""
+    db = await get_async_supabase()
+    result = await db.rpc('multi_query_search_project_chunks', {
+        'query_embeddings': query_embeddings,
+        'filter_project_id': project_id,
         'match_threshold': settings['similarity_threshold'],
         'chunks_per_search': settings['chunks_per_search']
     }).execute()
@@ -130,7 +164,77 @@ def vector_search(query: str, document_ids: List[str], settings: dict) -> List[D
     return result.data if result.data else []
 
 
-def build_context(chunks: List[Dict]) -> Tuple[List[str], List[str], List[str], List[Dict]]:
+class QueryRewrites(BaseModel):
+    queries: List[str]
+
+
+async def generate_query_rewrites(query: str, count: int) -> List[str]:
+    """Ask the LLM for `count` differently worded search queries in a single call"""
+    if count <= 0:
+        return []
+
+    structured_llm = query_rewrite_llm.with_structured_output(QueryRewrites)
+    result = await structured_llm.ainvoke([
+        SystemMessage(content=(
+            f"Rewrite the user's question into {count} different search queries for a document search engine. "
+            "Vary the wording, use synonyms and likely document terminology, and split compound questions. "
+            "Each query must stand on its own."
+        )),
+        HumanMessage(content=query)
+    ])
+
+    rewrites = [rewrite.strip() for rewrite in result.queries if rewrite.strip() and rewrite.strip() != query]
+    return list(dict.fromkeys(rewrites))[:count]
+
+
+async def load_settings_and_rewrites(query: str, project_id: str) -> Tuple[dict, List[List[float]]]:
+    """
+    Load project settings and, for multi-query retrieval, embed the query rewrites
+    (one LLM call for all rewrites, one batched embedding call)
+    
+    Returns:
+        Tuple of (settings, rewrite_embeddings)
+    """
+    settings = await load_project_settings(project_id)
+
+    if settings.get('rag_strategy') != 'multi-query':
+        return settings, []
+
+    try:
+        # The original query is one of the number_of_queries searches
+        rewrites = await generate_query_rewrites(query, settings['number_of_queries'] - 1)
+        print(f"🔀 Query rewrites: {rewrites}")
+        rewrite_embeddings = await embeddings_model.aembed_documents(rewrites) if rewrites else []
+    except Exception as e:
+        print(f"⚠️ Query rewriting failed, searching with the original query only: {e}")
+        return settings, []
+
+    return settings, rewrite_embeddings
+
+
+async def search_chunks(
+    query: str,
+    query_embedding: List[float],
+    project_id: str,
+    settings: dict,
+    rewrite_embeddings: List[List[float]] = None
+) -> List[Dict]:
+    """Run the retrieval selected by the project's rag_strategy"""
+    if settings.get('rag_strategy') == 'multi-query':
+        query_embeddings = [query_embedding, *(rewrite_embeddings or [])]
+        chunks = await multi_query_search(query_embeddings, project_id, settings)
+        print(f"✅ Retrieved {len(chunks)} relevant chunks from {len(query_embeddings)}-query search")
+    elif settings.get('rag_strategy') == 'hybrid':
+        chunks = await hybrid_search(query, query_embedding, project_id, settings)
+        print(f"✅ Retrieved {len(chunks)} relevant chunks from hybrid search")
+    else:
+        chunks = await vector_search(query_embedding, project_id, settings)
+        print(f"✅ Retrieved {len(chunks)} relevant chunks from vector search")
+
+    return chunks
+
+
+async def build_context(chunks: List[Dict]) -> Tuple[List[str], List[str], List[str], List[Dict]]:
     """
     Returns:
         Tuple of (texts, images, tables, citations)
@@ -139,23 +243,10 @@ def build_context(chunks: List[Dict]) -> Tuple[List[str], List[str], List[str],
         return [], [], [], []
     
     texts = []
-    images = []
+    image_refs = []
     tables = []
     citations = [] 
     
-    # Batch fetch all filenames in ONE query
-    doc_ids = [chunk['document_id'] for chunk in chunks if chunk.get('document_id')]
-    unique_doc_ids: List[str] = list(set(doc_ids))  # ✅ Fixed syntax
-    
-    filename_map = {}
-    
-    if unique_doc_ids:
-        result = supabase.table('project_documents')\
-            .select('id, filename')\
-            .in_('id', unique_doc_ids)\
-            .execute()
-        filename_map = {doc['id']: doc['filename'] for doc in result.data}
-    
     # Process each chunk
     for chunk in chunks:
         original_content = chunk.get('original_content', {})
@@ -168,7 +259,7 @@ def build_context(chunks: List[Dict]) -> Tuple[List[str], List[str], List[str],
         # Collect content
         if chunk_text:  # ✅ Add this check back
             texts.append(chunk_text)
-        images.extend(chunk_images)
+        image_refs.extend(chunk_images)
         tables.extend(chunk_tables)
         
         # Add citation for every chunk
@@ -177,21 +268,28 @@ def build_context(chunks: List[Dict]) -> Tuple[List[str], List[str], List[str],
             citations.append({
                 "chunk_id": chunk.get('id'),
                 "document_id": doc_id,
-                "filename": filename_map.get(doc_id, 'Unknown Document'),
+                "filename": chunk.get('filename') or 'Unknown Document',
                 "page": chunk.get('page_number', 'Unknown')
             })
     
+    # Only the images of chunks that made it into the context are fetched
+    unique_image_refs = list({
+        (ref["key"] if isinstance(ref, dict) else ref): ref for ref in image_refs
+    }.values())
+    # S3 reads are blocking, run them off the event loop
+    images = await asyncio.to_thread(fetch_images, unique_image_refs)
+    
     return texts, images, tables, citations
 
 
-def prepare_prompt_and_invoke_llm(
+def build_llm_messages(
     user_query: str,
     texts: List[str],
     images: List[str],
     tables: List[str]
-) -> str:
+) -> List:
     """
-    Builds system prompt with context and invokes LLM with multi-modal support
+    Builds system prompt with context and the multi-modal user message
     
     Args:
         user_query: The user's question
@@ -200,7 +298,7 @@ def prepare_prompt_and_invoke_llm(
         tables: List of HTML table strings
     
     Returns:
-        AI response string
+        Messages for the LLM
     """
     # Build system prompt parts
     prompt_parts = []
@@ -275,13 +373,10 @@ def prepare_prompt_and_invoke_llm(
         
         # Add each image to the content array
         for img_base64 in images:
-            # Clean base64 string if it has data URI prefix
-            if img_base64.startswith('data:image'):
-                img_base64 = img_base64.split(',', 1)[1]
-            
+            # Clean any data URI prefix and tag the real mime type (JPEG or WebP)
             content_parts.append({
                 "type": "image_url",
-                "image_url": {"url": f"data:image/jpeg;base64,{img_base64}"}
+                "image_url": {"url": image_data_url(img_base64)}
             })
         
         messages.append(HumanMessage(content=content_parts))
@@ -289,9 +384,21 @@ def prepare_prompt_and_invoke_llm(
         # Text-only message
         messages.append(HumanMessage(content=user_query))
     
+    return messages
+
+
+async def prepare_prompt_and_invoke_llm(
+    user_query: str,
+    texts: List[str],
+    images: List[str],
+    tables: List[str]
+) -> str:
+    """Builds the prompt and invokes the LLM, returns the AI response string"""
+    messages = build_llm_messages(user_query, texts, images, tables)
+    
     # Invoke LLM and return response
     print(f"🤖 Invoking LLM with {len(messages)} messages ({len(texts)} texts, {len(tables)} tables, {len(images)} images)...")
-    response = llm.invoke(messages)
+    response = await llm.ainvoke(messages)
     
     return response.content
 
@@ -300,6 +407,65 @@ def prepare_prompt_and_invoke_llm(
 class SendMessageRequest(BaseModel):
     content: str
 
+
+async def retrieve_context(message: str, chat_id: str, project_id: str, clerk_id: str):
+    """
+    Saves the user message and retrieves the context for it
+
+    Returns:
+        Tuple of (user_message, texts, images, tables, citations)
+    """
+    db = await get_async_supabase()
+
+    # 1-3 are independent, so they run concurrently:
+    # 1. Save user message
+    # 2. Load project settings (chunk size, similarity threshold, etc.), plus query rewrites for multi-query
+    # 3. Generate query embedding
+    print(f"💾 Saving user message, loading settings and embedding the query...")
+    user_message_result, (settings, rewrite_embeddings), query_embedding = await asyncio.gather(
+        db.table('messages').insert({
+            "chat_id": chat_id,
+            "content": message,
+            "role": "user",
+            "clerk_id": clerk_id
+        }).execute(),
+        load_settings_and_rewrites(message, project_id),
+        embeddings_model.aembed_query(message)
+    )
+    
+    user_message = user_message_result.data[0]
+    print(f"✅ User message saved: {user_message['id']}")
+
+    
+    # 4. Search this project's chunks (vector, hybrid or multi-query, per rag_strategy) in one RPC
+    chunks = await search_chunks(message, query_embedding, project_id, settings, rewrite_embeddings)
+
+
+    # 5. Build context from retrieved chunks
+    # Format the retrieved chunks into a structured context with citations
+    texts, images, tables, citations = await build_context(chunks)
+
+    return user_message, texts, images, tables, citations
+
+
+async def save_ai_message(chat_id: str, clerk_id: str, content: str, citations: List[Dict]) -> dict:
+    """Store the AI's response along with citations"""
+    print(f"💾 Saving AI message...")
+    db = await get_async_supabase()
+
+    ai_message_result = await db.table('messages').insert({
+        "chat_id": chat_id,
+        "content": content,
+        "role": "assistant",
+        "clerk_id": clerk_id,
+        "citations": citations
+    }).execute()
+    
+    ai_message = ai_message_result.data[0]
+    print(f"✅ AI message saved: {ai_message['id']}")
+    return ai_message
+
+
 @router.post("/api/projects/{project_id}/chats/{chat_id}/messages")
 async def send_message(
     chat_id: str,
@@ -315,41 +481,12 @@ async def send_message(
         
         print(f"💬 New message: {message[:50]}...")
         
-        # 1. Save user message
-        print(f"💾 Saving user message...")
-        user_message_result = supabase.table('messages').insert({
-            "chat_id": chat_id,
-            "content": message,
-            "role": "user",
-            "clerk_id": clerk_id
-        }).execute()
-        
-        user_message = user_message_result.data[0]
-        print(f"✅ User message saved: {user_message['id']}")
-        
-        # 2. Load project settings
-        # We need settings to know: chunk size, similarity threshold, etc.
-        settings = load_project_settings(project_id)
+        user_message, texts, images, tables, citations = await retrieve_context(message, chat_id, project_id, clerk_id)
         
-        # 3. Get document IDs for this project
-        # This narrows our search scope to only documents uploaded to this specific project
-        document_ids = get_document_ids(project_id)
-
-        
-        # 4. Generate query embedding
-        # 5. Perform vector search using the RPC function 
-        chunks = vector_search(message, document_ids, settings)
-        print(f"✅ Retrieved {len(chunks)} relevant chunks from vector search")
-
-
-        # 6. Build context from retrieved chunks
-        # Format the retrieved chunks into a structured context with citations
-        texts, images, tables, citations = build_context(chunks)
-        
-        # 7. Build system prompt with injected context
+        # 6. Build system prompt with injected context
         # Add the retrieved document context to the system prompt so the LLM can answer based on the documents
         print(f"🤖 Preparing context and calling LLM...")
-        ai_response = prepare_prompt_and_invoke_llm(
+        ai_response = await prepare_prompt_and_invoke_llm(
             user_query=message,
             texts=texts,
             images=images,
@@ -357,23 +494,10 @@ async def send_message(
         )
 
         
-        # 8. Save AI message with citations to database
-        # Store the AI's response along with citations
+        # 7. Save AI message with citations to database
+        ai_message = await save_ai_message(chat_id, clerk_id, ai_response, citations)
         
-        print(f"💾 Saving AI message...")
-
-        ai_message_result = supabase.table('messages').insert({
-            "chat_id": chat_id,
-            "content": ai_response,
-            "role": "assistant",
-            "clerk_id": clerk_id,
-            "citations": citations
-        }).execute()
-        
-        ai_message = ai_message_result.data[0]
-        print(f"✅ AI message saved: {ai_message['id']}")
-        
-        # 4. Return data
+        # 8. Return data
         return {
             "message": "Messages sent successfully",
             "data": {
@@ -384,4 +508,98 @@ async def send_message(
         
     except Exception as e:
         print(f"❌ Error in send_message: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Saves of partial answers after a disconnect, kept referenced until they finish
+_pending_saves = set()
+
+
+def sse_event(event: str, data) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@router.post("/api/projects/{project_id}/chats/{chat_id}/messages/stream")
+async def send_message_stream(
+    chat_id: str,
+    project_id: str,
+    request: SendMessageRequest,
+    clerk_id: str = Depends(get_current_user)
+):
+    """
+        User message → LLM → AI response, streamed as Server-Sent Events:
+        user_message, citations, token (one per chunk of the answer), then done (or error)
+    """
+    started_at = time.perf_counter()
+
+    try:
+        message = request.content
+        
+        print(f"💬 New streaming message: {message[:50]}...")
+
+        # Retrieval happens before the stream opens so failures still get a proper status code
+        user_message, texts, images, tables, citations = await retrieve_context(message, chat_id, project_id, clerk_id)
+        messages = build_llm_messages(message, texts, images, tables)
+
+    except Exception as e:
+        print(f"❌ Error in send_message_stream: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    retrieval_seconds = time.perf_counter() - started_at
+
+    async def event_stream():
+        answer_parts = []
+        first_token_at = None
+        saved = False
+
+        try:
+            yield sse_event("user_message", user_message)
+            yield sse_event("citations", citations)
+
+            print(f"🤖 Streaming LLM answer ({len(texts)} texts, {len(tables)} tables, {len(images)} images)...")
+            async for chunk in llm.astream(messages):
+                if not chunk.content:
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    print(f"⚡ Time to first token: {first_token_at - started_at:.2f}s")
+
+                answer_parts.append(chunk.content)
+                yield sse_event("token", {"content": chunk.content})
+
+            ai_message = await save_ai_message(chat_id, clerk_id, "".join(answer_parts), citations)
+            saved = True
+
+            total_seconds = time.perf_counter() - started_at
+            yield sse_event("done", {
+                "aiMessage": ai_message,
+                "metrics": {
+                    "retrieval_seconds": round(retrieval_seconds, 3),
+                    "ttft_seconds": round(first_token_at - started_at, 3) if first_token_at else None,
+                    "total_seconds": round(total_seconds, 3),
+                    "chunks_streamed": len(answer_parts)
+                }
+            })
+
+        except Exception as e:
+            print(f"❌ Error while streaming answer: {str(e)}")
+            yield sse_event("error", {"detail": str(e)})
+
+        finally:
+            # Client went away (or the LLM failed) mid-answer: keep what was generated.
+            # The save runs as its own task because this generator is being cancelled.
+            if not saved and answer_parts:
+                print(f"🔌 Stream ended early, saving partial answer ({len(answer_parts)} chunks)")
+                task = asyncio.create_task(save_ai_message(chat_id, clerk_id, "".join(answer_parts), citations))
+                _pending_saves.add(task)
+                task.add_done_callback(_pending_saves.discard)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # don't let a proxy buffer the stream
+        }
+    )
@@ -1,9 +1,25 @@
+import asyncio
 from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from typing import List, Optional
 from database import supabase, s3_client, BUCKET_NAME
 from auth import get_current_user
+from checkpoints import delete_checkpoints
+from crawler import CRAWL_MAX_DEPTH, CRAWL_MAX_PAGES
+from images import delete_unreferenced_images, document_image_keys, image_url
 import uuid
-from tasks import process_document
+from dispatch import enqueue
+from scheduler import submit_document, submit_documents
+from transfers import (
+    MULTIPART_MAX_PARTS,
+    abort_multipart_upload,
+    complete_multipart_upload,
+    create_multipart_upload,
+    head_uploads,
+    object_size,
+    plan_multipart_upload,
+    presign_upload_parts
+)
 
 router = APIRouter(
     tags=["files"]
@@ -15,6 +31,33 @@ class FileUploadRequest(BaseModel):
     file_type: str
 
 
+# Upper bound on files per batch upload / confirm request
+MAX_BATCH_FILES = 500
+
+# Upper bound on part URLs presigned per multipart parts request
+MULTIPART_PARTS_PER_REQUEST = 1000
+
+
+def new_document_s3_key(project_id: str, filename: str) -> str:
+    """ Generate a unique S3 key for an uploaded document """
+    file_extension = filename.split('.')[-1] if '.' in filename else ''
+    unique_id = str(uuid.uuid4())
+    return f"projects/{project_id}/documents/{unique_id}.{file_extension}"
+
+
+def presign_upload(s3_key: str, file_type: str) -> str:
+    """ Presigned PUT URL for the client to upload to (expires in 1 hour) """
+    return s3_client.generate_presigned_url(
+        'put_object',
+        Params={
+            'Bucket': BUCKET_NAME,
+            'Key': s3_key,
+            'ContentType': file_type
+        },
+        ExpiresIn=3600  # 1 hour
+    )
+
+
 @router.get("/api/projects/{project_id}/files")
 async def get_project_files(
     project_id: str, 
@@ -46,21 +89,8 @@ async def get_upload_url(
         if not projects_result.data:
             raise HTTPException(status_code=400, detail="Project not found or access denied")
         
-        # Generate unique S3 key
-        file_extension = file_request.filename.split('.')[-1] if '.' in file_request.filename else ''
-        unique_id = str(uuid.uuid4())
-        s3_key = f"projects/{project_id}/documents/{unique_id}.{file_extension}"
-
-        # Generate presigned URL (expire in 1 hour)
-        presigned_url = s3_client.generate_presigned_url(
-            'put_object',
-            Params={
-                'Bucket': BUCKET_NAME,
-                'Key': s3_key,
-                'ContentType': file_request.file_type
-            },
-            ExpiresIn=3600  # 1 hour
-        )
+        s3_key = new_document_s3_key(project_id, file_request.filename)
+        presigned_url = presign_upload(s3_key, file_request.file_type)
 
         # Create database record with pending status
         document_result = supabase.table("project_documents").insert({
@@ -101,28 +131,28 @@ async def confirm_file_upload(
         if not s3_key:
             raise HTTPException(status_code=400, detail="s3_key is required")
 
-        # Update document status
-        result = supabase.table("project_documents").update({
-            "processing_status": "queued"
-        }).eq("s3_key", s3_key).eq("project_id", project_id).eq("clerk_id", clerk_id).execute()
+        # Fingerprint the uploaded object so the worker can skip files it has already processed
+        head = s3_client.head_object(Bucket=BUCKET_NAME, Key=s3_key)
+        etag = head.get("ETag", "").strip('"')
 
-        document = result.data[0]
-        document_id = document['id']
+        # Update document status (with the size S3 reports, not the one the client declared)
+        result = supabase.table("project_documents").update({
+            "processing_status": "queued",
+            "file_size": head["ContentLength"],
+            "content_fingerprint": f"etag:{etag}" if etag else None
+        }).eq("s3_key", s3_key).eq("project_id", project_id).eq("clerk_id", clerk_id).eq("processing_status", "uploading").execute()
 
         if not result.data:
-            raise HTTPException(status_code=404, detail="Document not found or access denied")
+            raise HTTPException(status_code=404, detail="Document not found, already confirmed or access denied")
 
-        # Start background preprocessing of the current file with Celery
-        task = process_document.delay(document_id)
+        document = result.data[0]
 
-        # Store this task ID so that we can track it later if needed
-        supabase.table("project_documents").update({
-            "task_id": task.id
-        }).eq("id", document_id).execute()
+        # Queue for processing under this user's fair share; the scheduler records the task ID once it starts
+        submit_document(document)
 
         # Return JSON 
         return {
-            "message": "Upload confirmed, processing started with Celery", 
+            "message": "Upload confirmed, document queued for processing", 
             "data": document
         }
 
@@ -130,6 +160,284 @@ async def confirm_file_upload(
         raise HTTPException(status_code=500, detail = f"Failed to confirm upload: {str(e)}")
 
 
+class BatchUploadRequest(BaseModel):
+    files: List[FileUploadRequest]
+
+@router.post("/api/projects/{project_id}/files/batch/upload-url")
+async def get_batch_upload_urls(
+    project_id: str, 
+    batch_request: BatchUploadRequest, 
+    clerk_id: str = Depends(get_current_user)
+):
+    try:
+        if not batch_request.files:
+            raise HTTPException(status_code=400, detail="files is required")
+
+        if len(batch_request.files) > MAX_BATCH_FILES:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_FILES} files per batch")
+
+        # One ownership check for the whole batch
+        projects_result = supabase.table("projects").select("id").eq("id", project_id).eq("clerk_id", clerk_id).execute()
+
+        if not projects_result.data:
+            raise HTTPException(status_code=400, detail="Project not found or access denied")
+
+        # Presigning is local signing, no S3 round trip per file
+        s3_keys = [new_document_s3_key(project_id, file_request.filename) for file_request in batch_request.files]
+        presigned_urls = [
+            presign_upload(s3_key, file_request.file_type)
+            for s3_key, file_request in zip(s3_keys, batch_request.files)
+        ]
+
+        # Create all database records in a single insert
+        document_result = supabase.table("project_documents").insert([
+            {
+                "project_id": project_id,
+                'filename': file_request.filename,
+                's3_key': s3_key,
+                'file_size': file_request.file_size,
+                'file_type': file_request.file_type,
+                'processing_status': 'uploading',
+                'clerk_id': clerk_id 
+            }
+            for s3_key, file_request in zip(s3_keys, batch_request.files)
+        ]).execute()
+
+        if not document_result.data:
+            raise HTTPException(status_code=500, detail="Failed to create document records")
+
+        documents_by_key = {document['s3_key']: document for document in document_result.data}
+
+        return {
+            "message": "Upload URLs generated successfully",
+            "data": [
+                {
+                    "upload_url": presigned_url,
+                    "s3_key": s3_key,
+                    "document": documents_by_key.get(s3_key)
+                }
+                for s3_key, presigned_url in zip(s3_keys, presigned_urls)
+            ]
+        }
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail = f"Failed to generate the presigned URLs: {str(e)}")
+
+
+class BatchConfirmRequest(BaseModel):
+    s3_keys: List[str]
+
+@router.post("/api/projects/{project_id}/files/batch/confirm")
+async def confirm_batch_upload(
+    project_id: str, 
+    confirm_request: BatchConfirmRequest, 
+    clerk_id: str = Depends(get_current_user)
+):
+    try:
+        s3_keys = list(dict.fromkeys(confirm_request.s3_keys))
+
+        if not s3_keys:
+            raise HTTPException(status_code=400, detail="s3_keys is required")
+
+        if len(s3_keys) > MAX_BATCH_FILES:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_FILES} files per batch")
+
+        # Size and fingerprint come from S3, not the client; HEADs run in parallel off the event loop
+        uploads = await asyncio.to_thread(head_uploads, s3_keys)
+
+        # One call with the batch in the request body. Only documents still 'uploading' are
+        # confirmed, so a retried batch doesn't queue documents a second time
+        documents = []
+        if uploads:
+            result = supabase.rpc("confirm_uploads", {
+                "p_project_id": project_id,
+                "p_clerk_id": clerk_id,
+                "p_uploads": uploads
+            }).execute()
+            documents = result.data or []
+
+        if not documents:
+            raise HTTPException(status_code=404, detail="Documents not found or access denied")
+
+        # Queue the batch in one go under this user's fair share
+        submit_documents(documents)
+
+        confirmed_keys = {document['s3_key'] for document in documents}
+
+        return {
+            "message": "Uploads confirmed, documents queued for processing", 
+            "data": {
+                "documents": documents,
+                "not_found": [s3_key for s3_key in s3_keys if s3_key not in confirmed_keys]
+            }
+        }
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail = f"Failed to confirm uploads: {str(e)}")
+
+
+class MultipartPartsRequest(BaseModel):
+    s3_key: str
+    upload_id: str
+    part_numbers: List[int]
+
+class MultipartPart(BaseModel):
+    part_number: int
+    etag: str
+
+class MultipartCompleteRequest(BaseModel):
+    s3_key: str
+    upload_id: str
+    parts: List[MultipartPart]
+
+class MultipartAbortRequest(BaseModel):
+    s3_key: str
+    upload_id: str
+
+
+def get_uploading_document(project_id: str, s3_key: str, clerk_id: str) -> dict:
+    """ The user's document for an in-progress upload, or 404 (also once the upload was confirmed) """
+    result = supabase.table("project_documents").select("*").eq("s3_key", s3_key).eq("project_id", project_id).eq("clerk_id", clerk_id).eq("processing_status", "uploading").execute()
+
+    if not result.data:
+        raise HTTPException(status_code=404, detail="Document not found or access denied")
+
+    return result.data[0]
+
+
+@router.post("/api/projects/{project_id}/files/multipart/initiate")
+async def initiate_multipart_upload(
+    project_id: str, 
+    file_request: FileUploadRequest, 
+    clerk_id: str = Depends(get_current_user)
+):
+    try:
+        # Verify project exists and belongs to the user 
+        projects_result = supabase.table("projects").select("id").eq("id", project_id).eq("clerk_id", clerk_id).execute()
+
+        if not projects_result.data:
+            raise HTTPException(status_code=400, detail="Project not found or access denied")
+
+        s3_key = new_document_s3_key(project_id, file_request.filename)
+        upload_id = create_multipart_upload(s3_key, file_request.file_type)
+        part_size, part_count = plan_multipart_upload(file_request.file_size)
+
+        # Create database record with pending status
+        document_result = supabase.table("project_documents").insert({
+            "project_id": project_id,
+            'filename': file_request.filename,
+            's3_key': s3_key,
+            'file_size': file_request.file_size,
+            'file_type': file_request.file_type,
+            'processing_status': 'uploading',
+            'clerk_id': clerk_id 
+        }).execute()
+
+        if not document_result.data:
+            abort_multipart_upload(s3_key, upload_id)
+            raise HTTPException(status_code=500, detail="Failed to create document record")
+
+        return {
+            "message": "Multipart upload initiated successfully",
+            "data": {
+                "upload_id": upload_id,
+                "s3_key": s3_key,
+                "part_size": part_size,
+                "part_count": part_count,
+                "document": document_result.data[0]
+            }
+        }
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail = f"Failed to initiate multipart upload: {str(e)}")
+
+
+@router.post("/api/projects/{project_id}/files/multipart/parts")
+async def get_multipart_part_urls(
+    project_id: str, 
+    parts_request: MultipartPartsRequest, 
+    clerk_id: str = Depends(get_current_user)
+):
+    try:
+        if not parts_request.part_numbers or len(parts_request.part_numbers) > MULTIPART_PARTS_PER_REQUEST:
+            raise HTTPException(status_code=400, detail=f"Request between 1 and {MULTIPART_PARTS_PER_REQUEST} parts")
+
+        if any(part_number < 1 or part_number > MULTIPART_MAX_PARTS for part_number in parts_request.part_numbers):
+            raise HTTPException(status_code=400, detail=f"Part numbers must be between 1 and {MULTIPART_MAX_PARTS}")
+
+        get_uploading_document(project_id, parts_request.s3_key, clerk_id)
+
+        # The client PUTs each part straight to S3, several in parallel
+        return {
+            "message": "Part upload URLs generated successfully",
+            "data": presign_upload_parts(parts_request.s3_key, parts_request.upload_id, parts_request.part_numbers)
+        }
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail = f"Failed to generate part upload URLs: {str(e)}")
+
+
+@router.post("/api/projects/{project_id}/files/multipart/complete")
+async def complete_multipart_file_upload(
+    project_id: str, 
+    complete_request: MultipartCompleteRequest, 
+    clerk_id: str = Depends(get_current_user)
+):
+    try:
+        if not complete_request.parts:
+            raise HTTPException(status_code=400, detail="parts is required")
+
+        document = get_uploading_document(project_id, complete_request.s3_key, clerk_id)
+
+        etag = complete_multipart_upload(
+            complete_request.s3_key,
+            complete_request.upload_id,
+            [part.model_dump() for part in complete_request.parts]
+        )
+
+        # The declared size was only used to plan parts; record what S3 actually holds
+        file_size = object_size(complete_request.s3_key)
+        update_result = supabase.table("project_documents").update({
+            "file_size": file_size
+        }).eq("id", document["id"]).execute()
+        if update_result.data:
+            document = update_result.data[0]
+
+        # Processing starts with the usual confirm call
+        return {
+            "message": "Multipart upload completed successfully",
+            "data": {
+                "s3_key": complete_request.s3_key,
+                "etag": etag,
+                "document": document
+            }
+        }
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail = f"Failed to complete multipart upload: {str(e)}")
+
+
+@router.post("/api/projects/{project_id}/files/multipart/abort")
+async def abort_multipart_file_upload(
+    project_id: str, 
+    abort_request: MultipartAbortRequest, 
+    clerk_id: str = Depends(get_current_user)
+):
+    try:
+        document = get_uploading_document(project_id, abort_request.s3_key, clerk_id)
+
+        abort_multipart_upload(abort_request.s3_key, abort_request.upload_id)
+        supabase.table("project_documents").delete().eq("id", document['id']).execute()
+
+        return {
+            "message": "Multipart upload aborted successfully",
+            "data": document
+        }
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail = f"Failed to abort multipart upload: {str(e)}")
+
+
 class UrlAddRequest(BaseModel):
     url: str
 
@@ -163,19 +471,13 @@ async def add_website_url(
             raise HTTPException(status_code=500, detail="Failed to create URL record")
 
         document = result.data[0]
-        document_id = document['id']
  
-        # Start background preprocessing of the current file with Celery
-        task = process_document.delay(document_id)
-
-        # Store this task ID so that we can track it later if needed
-        supabase.table("project_documents").update({
-            "task_id": task.id
-        }).eq("id", document_id).execute()
+        # Queue for processing under this user's fair share
+        submit_document(document)
 
 
         return {
-            "message": "URL added successfully, processing started", 
+            "message": "URL added successfully, document queued for processing", 
             "data": result.data[0]
         }
         
@@ -183,6 +485,89 @@ async def add_website_url(
         raise HTTPException(status_code=500, detail=f"Failed to add URL: {str(e)}")
 
 
+class CrawlRequest(BaseModel):
+    url: Optional[str] = None
+    sitemap_url: Optional[str] = None
+    max_depth: int = Field(default=CRAWL_MAX_DEPTH, ge=1, le=CRAWL_MAX_DEPTH)
+    max_pages: int = Field(default=CRAWL_MAX_PAGES, ge=1, le=CRAWL_MAX_PAGES)
+    allowed_domains: List[str] = []
+
+@router.post("/api/projects/{project_id}/crawls")
+async def crawl_website_urls(
+    project_id: str, 
+    crawl_request: CrawlRequest, 
+    clerk_id: str = Depends(get_current_user)
+):
+    try:
+        if not crawl_request.url and not crawl_request.sitemap_url:
+            raise HTTPException(status_code=400, detail="url or sitemap_url is required")
+
+        # Verify project exists and belongs to the user 
+        projects_result = supabase.table("projects").select("id").eq("id", project_id).eq("clerk_id", clerk_id).execute()
+
+        if not projects_result.data:
+            raise HTTPException(status_code=404, detail="Project not found or access denied")
+
+        seed_url, sitemap_url = [
+            url.strip() if not url or url.strip().startswith(('http://', 'https://')) else "https://" + url.strip()
+            for url in (crawl_request.url, crawl_request.sitemap_url)
+        ]
+
+        # Pages show up as URL documents (and start processing) while the crawl runs
+        task = enqueue(
+            "crawl_website",
+            project_id,
+            clerk_id,
+            seed_url=seed_url,
+            sitemap_url=sitemap_url,
+            max_depth=crawl_request.max_depth,
+            max_pages=crawl_request.max_pages,
+            allowed_domains=crawl_request.allowed_domains or None
+        )
+
+        return {
+            "message": "Crawl started", 
+            "data": {
+                "task_id": task.id
+            }
+        }
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to start crawl: {str(e)}")
+
+
+@router.post("/api/projects/{project_id}/urls/{document_id}/refresh")
+async def refresh_website_url(
+    project_id: str, 
+    document_id: str, 
+    clerk_id: str = Depends(get_current_user)
+):
+    try:
+        # Verify the URL document exists and belongs to the user
+        doc_result = supabase.table("project_documents").select("id, project_id, clerk_id, filename, file_size, source_type").eq("id", document_id).eq("project_id", project_id).eq("clerk_id", clerk_id).execute()
+
+        if not doc_result.data:
+            raise HTTPException(status_code=404, detail="Document not found or access denied")
+
+        if doc_result.data[0].get("source_type") != "url":
+            raise HTTPException(status_code=400, detail="Only URL documents can be refreshed")
+
+        result = supabase.table("project_documents").update({
+            "processing_status": "queued"
+        }).eq("id", document_id).execute()
+
+        # Conditional re-fetch; only changed chunks are re-summarised and re-embedded
+        submit_document(doc_result.data[0], task_name="refresh_url_document")
+
+        return {
+            "message": "URL refresh started", 
+            "data": result.data[0]
+        }
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to refresh URL: {str(e)}")
+
+
 @router.delete("/api/projects/{project_id}/files/{file_id}")
 async def delete_file(
     project_id: str, 
@@ -209,6 +594,14 @@ async def delete_file(
             except Exception as s3_error:
                 print(f"Failed to delete from S3: {s3_error}")
 
+        # Stage checkpoints of a failed or still-running pipeline would otherwise stay in S3 forever
+        try:
+            delete_checkpoints(file_id)
+        except Exception as checkpoint_error:
+            print(f"Failed to delete checkpoints from S3: {checkpoint_error}")
+
+        # Image objects can be shared with other documents, collect them before the references cascade away
+        image_keys = document_image_keys(file_id)
 
         # Delete document record from DB 
         delete_result = (
@@ -221,6 +614,13 @@ async def delete_file(
         if not delete_result.data:
             raise HTTPException(status_code=500, detail="Failed to delete file")
 
+        try:
+            deleted_images = delete_unreferenced_images(image_keys)
+            if deleted_images:
+                print(f"Deleted {deleted_images} unreferenced images from S3")
+        except Exception as image_error:
+            print(f"Failed to delete images from S3: {image_error}")
+
         return {
             "message": "File deleted successfully", 
             "data": delete_result.data[0]
@@ -249,10 +649,17 @@ async def get_document_chunks(
             raise HTTPException(status_code=404, detail="Document not found")
         
         chunks_result = supabase.table('document_chunks').select('*').eq('document_id', file_id).order('chunk_index').execute()
+        chunks = chunks_result.data or []
+        
+        # Stored image references get a presigned URL the client can load directly
+        for chunk in chunks:
+            for image in (chunk.get('original_content') or {}).get('images', []):
+                if isinstance(image, dict):
+                    image['url'] = image_url(image)
         
         return {
             "message": "Document chunks retrieved successfully",
-            "data": chunks_result.data or []
+            "data": chunks
         }
 
     except Exception as e:
@@ -3,6 +3,8 @@ from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from database import supabase
 from auth import get_current_user
+from checkpoints import delete_checkpoints_for_documents
+from images import delete_unreferenced_images, project_image_keys
 
 router = APIRouter(
     tags=["projects"]
@@ -99,12 +101,29 @@ def delete_project(
         if not project_result.data: 
             raise HTTPException(status_code=404, detail="Project not found or access denied")
 
+        # Stage checkpoints of failed or still-running documents would otherwise stay in S3 forever
+        documents_result = supabase.table("project_documents").select("id").eq("project_id", project_id).execute()
+        try:
+            delete_checkpoints_for_documents([document["id"] for document in documents_result.data or []])
+        except Exception as checkpoint_error:
+            print(f"Failed to delete checkpoints from S3: {checkpoint_error}")
+
+        # Image objects can be shared across projects, collect them before the references cascade away
+        image_keys = project_image_keys(project_id)
+
         # Delete project (CASCADE handles all related data)
         deleted_result = supabase.table("projects").delete().eq("id", project_id).eq("clerk_id", clerk_id).execute()
 
         if not deleted_result.data: 
             raise HTTPException(status_code=500, detail="Failed to delete project")
 
+        try:
+            deleted_images = delete_unreferenced_images(image_keys)
+            if deleted_images:
+                print(f"Deleted {deleted_images} unreferenced images from S3")
+        except Exception as image_error:
+            print(f"Failed to delete images from S3: {image_error}")
+
         return {
             "message": "Project deleted successfully", 
             "data": deleted_result.data[0]
@@ -0,0 +1,229 @@
+import json
+import math
+import os
+import time
+
+from dispatch import CELERY_BROKER_URL, enqueue
+from database import supabase
+
+# Admission control: documents wait in per-tenant queues in Redis and are released
+# to Celery with deficit round robin, so one tenant's backlog can't hold every worker slot.
+SCHED_REDIS_URL = os.getenv("SCHED_REDIS_URL", CELERY_BROKER_URL)
+SCHED_MAX_INFLIGHT = int(os.getenv("SCHED_MAX_INFLIGHT", "16"))  # documents processing across all tenants
+SCHED_TENANT_MAX_INFLIGHT = int(os.getenv("SCHED_TENANT_MAX_INFLIGHT", "4"))  # per clerk_id
+SCHED_PROJECT_MAX_INFLIGHT = int(os.getenv("SCHED_PROJECT_MAX_INFLIGHT", "2"))  # per project
+SCHED_QUANTUM = float(os.getenv("SCHED_QUANTUM", "10"))  # cost units a tenant earns per round
+SCHED_COST_BYTES_PER_UNIT = int(os.getenv("SCHED_COST_BYTES_PER_UNIT", str(1024 * 1024)))
+SCHED_INFLIGHT_TTL_SECONDS = int(os.getenv("SCHED_INFLIGHT_TTL_SECONDS", str(6 * 3600)))  # presume lost after this
+SCHED_POSITION_UPDATES = int(os.getenv("SCHED_POSITION_UPDATES", "50"))  # queued docs per tenant that get a position
+
+# Relative processing cost per byte by file type (hi_res PDFs are the most expensive)
+COST_WEIGHTS = {
+    "pdf": 3.0,
+    "pptx": 2.0,
+    "docx": 2.0,
+}
+
+TENANTS_KEY = "sched:tenants"      # zset clerk_id -> last served time
+DEFICIT_KEY = "sched:deficit"      # hash clerk_id -> accumulated cost credit
+INFLIGHT_KEY = "sched:inflight"    # hash document_id -> job
+LOCK_KEY = "sched:lock"
+
+_redis = None
+
+
+def get_redis():
+    global _redis
+
+    if _redis is None:
+        import redis
+
+        _redis = redis.Redis.from_url(SCHED_REDIS_URL, decode_responses=True)
+    return _redis
+
+
+def pending_key(clerk_id: str) -> str:
+    return f"sched:pending:{clerk_id}"
+
+
+def estimate_cost(document: dict) -> float:
+    """ Rough processing cost from source type, file type and size """
+    if document.get("source_type") == "url":
+        return 1.0
+
+    file_type = document.get("filename", "").split(".")[-1].lower()
+    weight = COST_WEIGHTS.get(file_type, 1.0)
+    return round(1.0 + weight * (document.get("file_size") or 0) / SCHED_COST_BYTES_PER_UNIT, 2)
+
+
+def build_job(document: dict, task_name: str = "process_document") -> dict:
+    return {
+        "document_id": document["id"],
+        "project_id": document["project_id"],
+        "clerk_id": document["clerk_id"],
+        "cost": estimate_cost(document),
+        "task": task_name
+    }
+
+
+def submit_documents(documents: list, task_name: str = "process_document"):
+    """ Queue documents for processing under their owner's fair share, then dispatch what fits """
+    if not documents:
+        return
+
+    client = get_redis()
+    now = time.time()
+
+    pipeline = client.pipeline()
+    for document in documents:
+        job = build_job(document, task_name)
+        pipeline.rpush(pending_key(job["clerk_id"]), json.dumps(job))
+        # New tenants join the round robin at the back
+        pipeline.zadd(TENANTS_KEY, {job["clerk_id"]: now}, nx=True)
+    pipeline.execute()
+
+    dispatch_ready({document["clerk_id"] for document in documents})
+
+
+def submit_document(document: dict, task_name: str = "process_document"):
+    submit_documents([document], task_name)
+
+
+def release(document_id: str):
+    """ Free the slot held by a finished (or failed) document and dispatch the next jobs """
+    removed = get_redis().hdel(INFLIGHT_KEY, document_id)
+    if removed:
+        dispatch_ready()
+
+
+def _load_inflight(client) -> dict:
+    inflight = {document_id: json.loads(job) for document_id, job in client.hgetall(INFLIGHT_KEY).items()}
+
+    # Jobs whose worker died never release their slot
+    stale = [
+        document_id for document_id, job in inflight.items()
+        if time.time() - job.get("started_at", 0) > SCHED_INFLIGHT_TTL_SECONDS
+    ]
+    if stale:
+        client.hdel(INFLIGHT_KEY, *stale)
+        for document_id in stale:
+            inflight.pop(document_id)
+
+    return inflight
+
+
+def _next_eligible_job(client, clerk_id: str, inflight: dict):
+    """ First queued job of this tenant whose tenant/project limits allow it to start """
+    tenant_inflight = sum(1 for job in inflight.values() if job["clerk_id"] == clerk_id)
+    if tenant_inflight >= SCHED_TENANT_MAX_INFLIGHT:
+        return None, None
+
+    # Look a little past the head so one saturated project doesn't block the tenant's others
+    for raw_job in client.lrange(pending_key(clerk_id), 0, 9):
+        job = json.loads(raw_job)
+        project_inflight = sum(1 for running in inflight.values() if running["project_id"] == job["project_id"])
+        if project_inflight < SCHED_PROJECT_MAX_INFLIGHT:
+            return job, raw_job
+
+    return None, None
+
+
+def dispatch_ready(changed_tenants: set = None):
+    """ Deficit round robin over tenants: release queued jobs to Celery while slots are free """
+    client = get_redis()
+    changed_tenants = set(changed_tenants or ())
+
+    with client.lock(LOCK_KEY, timeout=30, blocking_timeout=10):
+        inflight = _load_inflight(client)
+        deficits = {clerk_id: float(value) for clerk_id, value in client.hgetall(DEFICIT_KEY).items()}
+
+        while len(inflight) < SCHED_MAX_INFLIGHT:
+            tenants = client.zrange(TENANTS_KEY, 0, -1)
+            dispatched = False
+            shortfalls = {}  # eligible tenants that couldn't afford their next job -> credit missing
+
+            for clerk_id in tenants:
+                if len(inflight) >= SCHED_MAX_INFLIGHT:
+                    break
+
+                if not client.llen(pending_key(clerk_id)):
+                    # Idle tenants leave the rotation and lose their credit
+                    client.zrem(TENANTS_KEY, clerk_id)
+                    deficits.pop(clerk_id, None)
+                    client.hdel(DEFICIT_KEY, clerk_id)
+                    continue
+
+                job, raw_job = _next_eligible_job(client, clerk_id, inflight)
+                if not job:
+                    continue
+
+                deficits[clerk_id] = deficits.get(clerk_id, 0.0) + SCHED_QUANTUM
+                if job["cost"] > deficits[clerk_id]:
+                    shortfalls[clerk_id] = job["cost"] - deficits[clerk_id]
+                    continue
+
+                deficits[clerk_id] -= job["cost"]
+                client.lrem(pending_key(clerk_id), 1, raw_job)
+
+                job["started_at"] = time.time()
+                inflight[job["document_id"]] = job
+                client.hset(INFLIGHT_KEY, job["document_id"], json.dumps(job))
+                client.zadd(TENANTS_KEY, {clerk_id: time.time()})
+                changed_tenants.add(clerk_id)
+                dispatched = True
+
+                _start_job(job)
+
+            if dispatched:
+                continue
+            if not shortfalls:
+                break
+
+            # Nobody could afford their job this round: skip ahead the rounds it would take the
+            # closest tenant to get there, so a job of any size is dispatched on the next pass
+            rounds_to_skip = math.ceil(min(shortfalls.values()) / SCHED_QUANTUM) - 1
+            for clerk_id in shortfalls:
+                deficits[clerk_id] += rounds_to_skip * SCHED_QUANTUM
+
+        if deficits:
+            client.hset(DEFICIT_KEY, mapping=deficits)
+
+        # Still under the lock, so positions match the queues as they are now
+        _report_positions(client, changed_tenants)
+
+
+def _start_job(job: dict):
+    task = enqueue(job["task"], job["document_id"])
+    supabase.table("project_documents").update({
+        "task_id": task.id
+    }).eq("id", job["document_id"]).execute()
+    print(f"🚦 Dispatched {job['task']} for document {job['document_id']} (tenant {job['clerk_id']}, cost {job['cost']})")
+
+
+def _report_positions(client, clerk_ids: set):
+    """ Write each waiting document's place in its tenant queue to processing_details, in one call """
+    if not clerk_ids:
+        return
+
+    active_tenants = max(client.zcard(TENANTS_KEY), 1)
+    positions = []
+
+    for clerk_id in clerk_ids:
+        queue_length = client.llen(pending_key(clerk_id))
+        queued = client.lrange(pending_key(clerk_id), 0, SCHED_POSITION_UPDATES - 1)
+
+        for position, raw_job in enumerate(queued, 1):
+            positions.append({
+                "document_id": json.loads(raw_job)["document_id"],
+                "queue": {
+                    "position": position,
+                    "tenant_queue_length": queue_length,
+                    "active_tenants": active_tenants,
+                    # Under fair sharing each active tenant gets roughly one slot per round
+                    "estimated_global_position": position * active_tenants
+                }
+            })
+
+    if positions:
+        # Only rows still 'queued' are updated, dispatched or finished documents keep their status
+        supabase.rpc("update_queue_positions", {"p_positions": positions}).execute()
@@ -0,0 +1,40 @@
+-- Whole-document deduplication
+-- Documents carry a content fingerprint (S3 ETag or streamed SHA-256) and the
+-- pipeline version that produced their chunks, so an identical upload can clone
+-- the chunks of an already processed copy instead of running the pipeline again.
+
+ALTER TABLE project_documents ADD COLUMN IF NOT EXISTS content_fingerprint TEXT;
+ALTER TABLE project_documents ADD COLUMN IF NOT EXISTS pipeline_version TEXT;
+
+CREATE INDEX IF NOT EXISTS project_documents_fingerprint_idx
+    ON project_documents (clerk_id, content_fingerprint, pipeline_version)
+    WHERE processing_status = 'completed';
+
+
+CREATE OR REPLACE FUNCTION clone_document_chunks(
+    source_document_id uuid,
+    target_document_id uuid
+)
+RETURNS integer
+LANGUAGE plpgsql
+AS $function$
+DECLARE
+    cloned_count integer;
+BEGIN
+    -- Safe to re-run: a retried clone replaces any partial copy
+    DELETE FROM document_chunks WHERE document_id = target_document_id;
+
+    INSERT INTO document_chunks (
+        document_id, content, chunk_index, page_number, char_count, type, original_content, embedding
+    )
+    SELECT
+        target_document_id, dc.content, dc.chunk_index, dc.page_number, dc.char_count, dc.type, dc.original_content, dc.embedding
+    FROM
+        document_chunks dc
+    WHERE
+        dc.document_id = source_document_id;
+
+    GET DIAGNOSTICS cloned_count = ROW_COUNT;
+    RETURN cloned_count;
+END;
+$function$;
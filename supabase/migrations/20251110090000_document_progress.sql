@@ -0,0 +1,21 @@
+-- Write-only progress updates
+-- Merges the given keys into processing_details server-side, so workers can
+-- report progress without reading the row first.
+
+CREATE OR REPLACE FUNCTION update_document_progress(
+    p_document_id uuid,
+    p_status text,
+    p_details jsonb DEFAULT '{}'::jsonb
+)
+RETURNS void
+LANGUAGE sql
+AS $function$
+UPDATE project_documents
+SET
+    processing_status = p_status,
+    processing_details = (
+        COALESCE(processing_details::jsonb, '{}'::jsonb) || COALESCE(p_details, '{}'::jsonb)
+    )::json
+WHERE
+    id = p_document_id;
+$function$;
@@ -0,0 +1,42 @@
+-- Incremental refresh of URL documents
+-- project_documents remembers the validators and hash of the last fetch, and
+-- every chunk carries a hash of its source content so a refresh only
+-- re-summarises and re-embeds chunks that actually changed.
+
+ALTER TABLE project_documents ADD COLUMN IF NOT EXISTS source_etag TEXT;
+ALTER TABLE project_documents ADD COLUMN IF NOT EXISTS source_last_modified TEXT;
+ALTER TABLE project_documents ADD COLUMN IF NOT EXISTS source_content_hash TEXT;
+
+ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+CREATE INDEX IF NOT EXISTS document_chunks_document_hash_idx ON document_chunks (document_id, content_hash);
+
+
+-- Cloned documents keep the chunk hashes too
+CREATE OR REPLACE FUNCTION clone_document_chunks(
+    source_document_id uuid,
+    target_document_id uuid
+)
+RETURNS integer
+LANGUAGE plpgsql
+AS $function$
+DECLARE
+    cloned_count integer;
+BEGIN
+    -- Safe to re-run: a retried clone replaces any partial copy
+    DELETE FROM document_chunks WHERE document_id = target_document_id;
+
+    INSERT INTO document_chunks (
+        document_id, content, chunk_index, page_number, char_count, type, original_content, embedding, content_hash
+    )
+    SELECT
+        target_document_id, dc.content, dc.chunk_index, dc.page_number, dc.char_count, dc.type, dc.original_content, dc.embedding, dc.content_hash
+    FROM
+        document_chunks dc
+    WHERE
+        dc.document_id = source_document_id;
+
+    GET DIAGNOSTICS cloned_count = ROW_COUNT;
+    RETURN cloned_count;
+END;
+$function$;
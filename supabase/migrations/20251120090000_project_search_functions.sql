@@ -0,0 +1,93 @@
+-- Project-scoped chunk search
+-- Filters by joining project_documents on project_id instead of taking an array of
+-- document IDs from the caller, and returns only what the chat path reads:
+-- no embedding vector, with the document's filename for citations.
+
+CREATE INDEX IF NOT EXISTS project_documents_project_id_idx ON project_documents (project_id);
+CREATE INDEX IF NOT EXISTS document_chunks_document_id_idx ON document_chunks (document_id);
+
+
+CREATE OR REPLACE FUNCTION vector_search_project_chunks(
+    query_embedding vector,
+    filter_project_id uuid,
+    match_threshold double precision DEFAULT 0.3,
+    chunks_per_search integer DEFAULT 20
+)
+RETURNS TABLE(
+    id uuid,
+    document_id uuid,
+    filename text,
+    content text,
+    chunk_index integer,
+    page_number integer,
+    type jsonb,
+    original_content jsonb,
+    similarity double precision
+)
+LANGUAGE sql
+STABLE
+AS $function$
+SELECT
+    dc.id,
+    dc.document_id,
+    pd.filename,
+    dc.content,
+    dc.chunk_index,
+    dc.page_number,
+    dc.type::jsonb,
+    dc.original_content::jsonb,
+    1 - (dc.embedding <=> query_embedding) AS similarity
+FROM
+    document_chunks dc
+    JOIN project_documents pd ON pd.id = dc.document_id
+WHERE
+    pd.project_id = filter_project_id
+    AND dc.embedding IS NOT NULL
+    AND (1 - (dc.embedding <=> query_embedding)) > match_threshold
+ORDER BY
+    dc.embedding <=> query_embedding ASC
+LIMIT
+    chunks_per_search;
+$function$;
+
+
+CREATE OR REPLACE FUNCTION keyword_search_project_chunks(
+    query_text text,
+    filter_project_id uuid,
+    chunks_per_search integer DEFAULT 20
+)
+RETURNS TABLE(
+    id uuid,
+    document_id uuid,
+    filename text,
+    content text,
+    chunk_index integer,
+    page_number integer,
+    type jsonb,
+    original_content jsonb,
+    rank real
+)
+LANGUAGE sql
+STABLE
+AS $function$
+SELECT
+    dc.id,
+    dc.document_id,
+    pd.filename,
+    dc.content,
+    dc.chunk_index,
+    dc.page_number,
+    dc.type::jsonb,
+    dc.original_content::jsonb,
+    ts_rank_cd(dc.fts, websearch_to_tsquery('english', query_text)) AS rank
+FROM
+    document_chunks dc
+    JOIN project_documents pd ON pd.id = dc.document_id
+WHERE
+    pd.project_id = filter_project_id
+    AND dc.fts @@ websearch_to_tsquery('english', query_text)
+ORDER BY
+    rank DESC
+LIMIT
+    chunks_per_search;
+$function$;
@@ -0,0 +1,95 @@
+-- Hybrid search: vector + keyword in one round trip
+-- Each side ranks up to 2 x chunks_per_search candidates from the project; the two
+-- rankings are fused with weighted reciprocal rank fusion:
+--     score = vector_weight / (rrf_k + vector_rank) + keyword_weight / (rrf_k + keyword_rank)
+-- A chunk found by both searches appears once, with both contributions.
+
+CREATE OR REPLACE FUNCTION hybrid_search_project_chunks(
+    query_text text,
+    query_embedding vector,
+    filter_project_id uuid,
+    match_threshold double precision DEFAULT 0.3,
+    chunks_per_search integer DEFAULT 20,
+    vector_weight double precision DEFAULT 0.7,
+    keyword_weight double precision DEFAULT 0.3,
+    rrf_k integer DEFAULT 60
+)
+RETURNS TABLE(
+    id uuid,
+    document_id uuid,
+    filename text,
+    content text,
+    chunk_index integer,
+    page_number integer,
+    type jsonb,
+    original_content jsonb,
+    score double precision,
+    vector_rank bigint,
+    keyword_rank bigint
+)
+LANGUAGE sql
+STABLE
+AS $function$
+WITH vector_matches AS (
+    SELECT
+        dc.id,
+        ROW_NUMBER() OVER (ORDER BY dc.embedding <=> query_embedding ASC) AS rank_ix
+    FROM
+        document_chunks dc
+        JOIN project_documents pd ON pd.id = dc.document_id
+    WHERE
+        pd.project_id = filter_project_id
+        AND dc.embedding IS NOT NULL
+        AND (1 - (dc.embedding <=> query_embedding)) > match_threshold
+    ORDER BY
+        dc.embedding <=> query_embedding ASC
+    LIMIT
+        chunks_per_search * 2
+),
+keyword_matches AS (
+    SELECT
+        dc.id,
+        ROW_NUMBER() OVER (ORDER BY ts_rank_cd(dc.fts, websearch_to_tsquery('english', query_text)) DESC) AS rank_ix
+    FROM
+        document_chunks dc
+        JOIN project_documents pd ON pd.id = dc.document_id
+    WHERE
+        pd.project_id = filter_project_id
+        AND dc.fts @@ websearch_to_tsquery('english', query_text)
+    ORDER BY
+        rank_ix
+    LIMIT
+        chunks_per_search * 2
+),
+fused AS (
+    SELECT
+        COALESCE(v.id, k.id) AS id,
+        COALESCE(vector_weight / (rrf_k + v.rank_ix), 0.0)
+            + COALESCE(keyword_weight / (rrf_k + k.rank_ix), 0.0) AS score,
+        v.rank_ix AS vector_rank,
+        k.rank_ix AS keyword_rank
+    FROM
+        vector_matches v
+        FULL OUTER JOIN keyword_matches k ON k.id = v.id
+)
+SELECT
+    dc.id,
+    dc.document_id,
+    pd.filename,
+    dc.content,
+    dc.chunk_index,
+    dc.page_number,
+    dc.type::jsonb,
+    dc.original_content::jsonb,
+    f.score,
+    f.vector_rank,
+    f.keyword_rank
+FROM
+    fused f
+    JOIN document_chunks dc ON dc.id = f.id
+    JOIN project_documents pd ON pd.id = dc.document_id
+ORDER BY
+    f.score DESC
+LIMIT
+    chunks_per_search;
+$function$;
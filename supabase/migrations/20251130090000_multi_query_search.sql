@@ -0,0 +1,89 @@
+-- Multi-query search: N query embeddings in one round trip
+-- Runs one nearest-neighbour search per embedding (LATERAL, each LIMITed to
+-- chunks_per_search so every search can use the HNSW index), then fuses the N
+-- rankings with reciprocal rank fusion:
+--     score = sum over queries of 1 / (rrf_k + rank)
+-- Chunks returned by several queries appear once, ranked higher.
+
+CREATE OR REPLACE FUNCTION multi_query_search_project_chunks(
+    query_embeddings jsonb,
+    filter_project_id uuid,
+    match_threshold double precision DEFAULT 0.3,
+    chunks_per_search integer DEFAULT 20,
+    rrf_k integer DEFAULT 60
+)
+RETURNS TABLE(
+    id uuid,
+    document_id uuid,
+    filename text,
+    content text,
+    chunk_index integer,
+    page_number integer,
+    type jsonb,
+    original_content jsonb,
+    score double precision,
+    query_hits bigint
+)
+LANGUAGE sql
+STABLE
+AS $function$
+WITH queries AS (
+    SELECT
+        q.ordinality AS query_ix,
+        (q.value::text)::vector AS embedding
+    FROM
+        jsonb_array_elements(query_embeddings) WITH ORDINALITY AS q(value, ordinality)
+),
+matches AS (
+    SELECT
+        m.id,
+        ROW_NUMBER() OVER (PARTITION BY queries.query_ix ORDER BY m.distance ASC) AS rank_ix
+    FROM
+        queries
+        CROSS JOIN LATERAL (
+            SELECT
+                dc.id,
+                dc.embedding <=> queries.embedding AS distance
+            FROM
+                document_chunks dc
+                JOIN project_documents pd ON pd.id = dc.document_id
+            WHERE
+                pd.project_id = filter_project_id
+                AND dc.embedding IS NOT NULL
+                AND (1 - (dc.embedding <=> queries.embedding)) > match_threshold
+            ORDER BY
+                dc.embedding <=> queries.embedding ASC
+            LIMIT
+                chunks_per_search
+        ) m
+),
+fused AS (
+    SELECT
+        matches.id,
+        SUM(1.0 / (rrf_k + matches.rank_ix))::double precision AS score,
+        COUNT(*) AS query_hits
+    FROM
+        matches
+    GROUP BY
+        matches.id
+)
+SELECT
+    dc.id,
+    dc.document_id,
+    pd.filename,
+    dc.content,
+    dc.chunk_index,
+    dc.page_number,
+    dc.type::jsonb,
+    dc.original_content::jsonb,
+    f.score,
+    f.query_hits
+FROM
+    fused f
+    JOIN document_chunks dc ON dc.id = f.id
+    JOIN project_documents pd ON pd.id = dc.document_id
+ORDER BY
+    f.score DESC
+LIMIT
+    chunks_per_search;
+$function$;
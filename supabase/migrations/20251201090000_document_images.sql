@@ -0,0 +1,99 @@
+-- Image references
+-- Chunk images live in content-addressed S3 objects (images/<sha256>.<ext>) that
+-- several documents can share. document_images records which documents use which
+-- object, so an object is deleted once the last document referencing it is gone.
+
+CREATE TABLE IF NOT EXISTS document_images (
+    document_id UUID NOT NULL REFERENCES project_documents(id) ON DELETE CASCADE,
+    image_key TEXT NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT now(),
+    PRIMARY KEY (document_id, image_key)
+);
+
+CREATE INDEX IF NOT EXISTS document_images_image_key_idx ON document_images (image_key);
+
+-- Backfill from chunks stored before references were tracked
+INSERT INTO document_images (document_id, image_key)
+SELECT DISTINCT
+    dc.document_id,
+    image->>'key'
+FROM
+    document_chunks dc,
+    jsonb_array_elements(COALESCE(dc.original_content::jsonb->'images', '[]'::jsonb)) AS image
+WHERE
+    jsonb_typeof(image) = 'object'
+    AND image->>'key' IS NOT NULL
+ON CONFLICT DO NOTHING;
+
+
+-- Image objects referenced by any document of a project (collected before the project is deleted)
+CREATE OR REPLACE FUNCTION project_image_keys(p_project_id uuid)
+RETURNS SETOF text
+LANGUAGE sql
+STABLE
+AS $function$
+SELECT DISTINCT
+    di.image_key
+FROM
+    document_images di
+    JOIN project_documents pd ON pd.id = di.document_id
+WHERE
+    pd.project_id = p_project_id;
+$function$;
+
+
+-- The given keys that no document references any more
+CREATE OR REPLACE FUNCTION unreferenced_image_keys(p_image_keys text[])
+RETURNS SETOF text
+LANGUAGE sql
+STABLE
+AS $function$
+SELECT
+    k.image_key
+FROM
+    unnest(p_image_keys) AS k(image_key)
+WHERE
+    NOT EXISTS (
+        SELECT 1 FROM document_images di WHERE di.image_key = k.image_key
+    );
+$function$;
+
+
+-- Cloned documents reference the same image objects as their source
+CREATE OR REPLACE FUNCTION clone_document_chunks(
+    source_document_id uuid,
+    target_document_id uuid
+)
+RETURNS integer
+LANGUAGE plpgsql
+AS $function$
+DECLARE
+    cloned_count integer;
+BEGIN
+    -- Safe to re-run: a retried clone replaces any partial copy
+    DELETE FROM document_chunks WHERE document_id = target_document_id;
+
+    INSERT INTO document_chunks (
+        document_id, content, chunk_index, page_number, char_count, type, original_content, embedding, content_hash
+    )
+    SELECT
+        target_document_id, dc.content, dc.chunk_index, dc.page_number, dc.char_count, dc.type, dc.original_content, dc.embedding, dc.content_hash
+    FROM
+        document_chunks dc
+    WHERE
+        dc.document_id = source_document_id;
+
+    GET DIAGNOSTICS cloned_count = ROW_COUNT;
+
+    INSERT INTO document_images (document_id, image_key)
+    SELECT
+        target_document_id, di.image_key
+    FROM
+        document_images di
+    WHERE
+        di.document_id = source_document_id
+    ON CONFLICT DO NOTHING;
+
+    RETURN cloned_count;
+END;
+$function$;
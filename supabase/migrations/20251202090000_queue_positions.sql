@@ -0,0 +1,20 @@
+-- Queue positions in one round trip
+-- The scheduler writes every waiting document's place in its tenant queue with a
+-- single call. Only rows still queued are touched, so a position computed just
+-- before a document was dispatched (or finished) can't overwrite its newer status.
+
+CREATE OR REPLACE FUNCTION update_queue_positions(p_positions jsonb)
+RETURNS void
+LANGUAGE sql
+AS $function$
+UPDATE project_documents pd
+SET
+    processing_details = (
+        COALESCE(pd.processing_details::jsonb, '{}'::jsonb) || jsonb_build_object('queue', p.value->'queue')
+    )::json
+FROM
+    jsonb_array_elements(p_positions) AS p(value)
+WHERE
+    pd.id = (p.value->>'document_id')::uuid
+    AND pd.processing_status = 'queued';
+$function$;
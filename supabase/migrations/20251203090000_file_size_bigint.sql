@@ -0,0 +1,2 @@
+-- Multipart uploads go well past 2 GB, which overflows INTEGER
+ALTER TABLE project_documents ALTER COLUMN file_size TYPE BIGINT;
@@ -0,0 +1,266 @@
+-- Search results without the AI summary
+-- The chat path builds its context from original_content (plus document_id,
+-- filename and page_number); the summary in content is only what gets embedded.
+-- Returning it doubled the payload of every search for nothing. The return type
+-- changes, so each function is dropped and re-created.
+
+
+DROP FUNCTION IF EXISTS vector_search_project_chunks(vector, uuid, double precision, integer);
+
+CREATE OR REPLACE FUNCTION vector_search_project_chunks(
+    query_embedding vector,
+    filter_project_id uuid,
+    match_threshold double precision DEFAULT 0.3,
+    chunks_per_search integer DEFAULT 20
+)
+RETURNS TABLE(
+    id uuid,
+    document_id uuid,
+    filename text,
+    chunk_index integer,
+    page_number integer,
+    type jsonb,
+    original_content jsonb,
+    similarity double precision
+)
+LANGUAGE sql
+STABLE
+AS $function$
+SELECT
+    dc.id,
+    dc.document_id,
+    pd.filename,
+    dc.chunk_index,
+    dc.page_number,
+    dc.type::jsonb,
+    dc.original_content::jsonb,
+    1 - (dc.embedding <=> query_embedding) AS similarity
+FROM
+    document_chunks dc
+    JOIN project_documents pd ON pd.id = dc.document_id
+WHERE
+    pd.project_id = filter_project_id
+    AND dc.embedding IS NOT NULL
+    AND (1 - (dc.embedding <=> query_embedding)) > match_threshold
+ORDER BY
+    dc.embedding <=> query_embedding ASC
+LIMIT
+    chunks_per_search;
+$function$;
+
+
+DROP FUNCTION IF EXISTS keyword_search_project_chunks(text, uuid, integer);
+
+CREATE OR REPLACE FUNCTION keyword_search_project_chunks(
+    query_text text,
+    filter_project_id uuid,
+    chunks_per_search integer DEFAULT 20
+)
+RETURNS TABLE(
+    id uuid,
+    document_id uuid,
+    filename text,
+    chunk_index integer,
+    page_number integer,
+    type jsonb,
+    original_content jsonb,
+    rank real
+)
+LANGUAGE sql
+STABLE
+AS $function$
+SELECT
+    dc.id,
+    dc.document_id,
+    pd.filename,
+    dc.chunk_index,
+    dc.page_number,
+    dc.type::jsonb,
+    dc.original_content::jsonb,
+    ts_rank_cd(dc.fts, websearch_to_tsquery('english', query_text)) AS rank
+FROM
+    document_chunks dc
+    JOIN project_documents pd ON pd.id = dc.document_id
+WHERE
+    pd.project_id = filter_project_id
+    AND dc.fts @@ websearch_to_tsquery('english', query_text)
+ORDER BY
+    rank DESC
+LIMIT
+    chunks_per_search;
+$function$;
+
+
+DROP FUNCTION IF EXISTS hybrid_search_project_chunks(text, vector, uuid, double precision, integer, double precision, double precision, integer);
+
+CREATE OR REPLACE FUNCTION hybrid_search_project_chunks(
+    query_text text,
+    query_embedding vector,
+    filter_project_id uuid,
+    match_threshold double precision DEFAULT 0.3,
+    chunks_per_search integer DEFAULT 20,
+    vector_weight double precision DEFAULT 0.7,
+    keyword_weight double precision DEFAULT 0.3,
+    rrf_k integer DEFAULT 60
+)
+RETURNS TABLE(
+    id uuid,
+    document_id uuid,
+    filename text,
+    chunk_index integer,
+    page_number integer,
+    type jsonb,
+    original_content jsonb,
+    score double precision,
+    vector_rank bigint,
+    keyword_rank bigint
+)
+LANGUAGE sql
+STABLE
+AS $function$
+WITH vector_matches AS (
+    SELECT
+        dc.id,
+        ROW_NUMBER() OVER (ORDER BY dc.embedding <=> query_embedding ASC) AS rank_ix
+    FROM
+        document_chunks dc
+        JOIN project_documents pd ON pd.id = dc.document_id
+    WHERE
+        pd.project_id = filter_project_id
+        AND dc.embedding IS NOT NULL
+        AND (1 - (dc.embedding <=> query_embedding)) > match_threshold
+    ORDER BY
+        dc.embedding <=> query_embedding ASC
+    LIMIT
+        chunks_per_search * 2
+),
+keyword_matches AS (
+    SELECT
+        dc.id,
+        ROW_NUMBER() OVER (ORDER BY ts_rank_cd(dc.fts, websearch_to_tsquery('english', query_text)) DESC) AS rank_ix
+    FROM
+        document_chunks dc
+        JOIN project_documents pd ON pd.id = dc.document_id
+    WHERE
+        pd.project_id = filter_project_id
+        AND dc.fts @@ websearch_to_tsquery('english', query_text)
+    ORDER BY
+        rank_ix
+    LIMIT
+        chunks_per_search * 2
+),
+fused AS (
+    SELECT
+        COALESCE(v.id, k.id) AS id,
+        COALESCE(vector_weight / (rrf_k + v.rank_ix), 0.0)
+            + COALESCE(keyword_weight / (rrf_k + k.rank_ix), 0.0) AS score,
+        v.rank_ix AS vector_rank,
+        k.rank_ix AS keyword_rank
+    FROM
+        vector_matches v
+        FULL OUTER JOIN keyword_matches k ON k.id = v.id
+)
+SELECT
+    dc.id,
+    dc.document_id,
+    pd.filename,
+    dc.chunk_index,
+    dc.page_number,
+    dc.type::jsonb,
+    dc.original_content::jsonb,
+    f.score,
+    f.vector_rank,
+    f.keyword_rank
+FROM
+    fused f
+    JOIN document_chunks dc ON dc.id = f.id
+    JOIN project_documents pd ON pd.id = dc.document_id
+ORDER BY
+    f.score DESC
+LIMIT
+    chunks_per_search;
+$function$;
+
+
+DROP FUNCTION IF EXISTS multi_query_search_project_chunks(jsonb, uuid, double precision, integer, integer);
+
+CREATE OR REPLACE FUNCTION multi_query_search_project_chunks(
+    query_embeddings jsonb,
+    filter_project_id uuid,
+    match_threshold double precision DEFAULT 0.3,
+    chunks_per_search integer DEFAULT 20,
+    rrf_k integer DEFAULT 60
+)
+RETURNS TABLE(
+    id uuid,
+    document_id uuid,
+    filename text,
+    chunk_index integer,
+    page_number integer,
+    type jsonb,
+    original_content jsonb,
+    score double precision,
+    query_hits bigint
+)
+LANGUAGE sql
+STABLE
+AS $function$
+WITH queries AS (
+    SELECT
+        q.ordinality AS query_ix,
+        (q.value::text)::vector AS embedding
+    FROM
+        jsonb_array_elements(query_embeddings) WITH ORDINALITY AS q(value, ordinality)
+),
+matches AS (
+    SELECT
+        m.id,
+        ROW_NUMBER() OVER (PARTITION BY queries.query_ix ORDER BY m.distance ASC) AS rank_ix
+    FROM
+        queries
+        CROSS JOIN LATERAL (
+            SELECT
+                dc.id,
+                dc.embedding <=> queries.embedding AS distance
+            FROM
+                document_chunks dc
+                JOIN project_documents pd ON pd.id = dc.document_id
+            WHERE
+                pd.project_id = filter_project_id
+                AND dc.embedding IS NOT NULL
+                AND (1 - (dc.embedding <=> queries.embedding)) > match_threshold
+            ORDER BY
+                dc.embedding <=> queries.embedding ASC
+            LIMIT
+                chunks_per_search
+        ) m
+),
+fused AS (
+    SELECT
+        matches.id,
+        SUM(1.0 / (rrf_k + matches.rank_ix))::double precision AS score,
+        COUNT(*) AS query_hits
+    FROM
+        matches
+    GROUP BY
+        matches.id
+)
+SELECT
+    dc.id,
+    dc.document_id,
+    pd.filename,
+    dc.chunk_index,
+    dc.page_number,
+    dc.type::jsonb,
+    dc.original_content::jsonb,
+    f.score,
+    f.query_hits
+FROM
+    fused f
+    JOIN document_chunks dc ON dc.id = f.id
+    JOIN project_documents pd ON pd.id = dc.document_id
+ORDER BY
+    f.score DESC
+LIMIT
+    chunks_per_search;
+$function$;
@@ -0,0 +1,29 @@
+-- Batch upload confirmation in one round trip
+-- Takes [{s3_key, file_size, content_fingerprint}] (sizes and fingerprints from a
+-- HEAD of each object) in the request body and queues the matching documents.
+-- Only documents still 'uploading' are touched, so confirming a batch twice
+-- doesn't queue anything a second time.
+
+CREATE OR REPLACE FUNCTION confirm_uploads(
+    p_project_id uuid,
+    p_clerk_id text,
+    p_uploads jsonb
+)
+RETURNS SETOF project_documents
+LANGUAGE sql
+AS $function$
+UPDATE project_documents pd
+SET
+    processing_status = 'queued',
+    file_size = (u.value->>'file_size')::bigint,
+    content_fingerprint = u.value->>'content_fingerprint'
+FROM
+    jsonb_array_elements(p_uploads) AS u(value)
+WHERE
+    pd.s3_key = u.value->>'s3_key'
+    AND pd.project_id = p_project_id
+    AND pd.clerk_id = p_clerk_id
+    AND pd.processing_status = 'uploading'
+RETURNING
+    pd.*;
+$function$;
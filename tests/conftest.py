@@ -0,0 +1,13 @@
+import os
+
+# database.py builds its clients at import time; give it placeholder credentials
+for name, value in {
+    "SUPABASE_API_URL": "http://localhost:54321",
+    "SUPABASE_SERVICE_KEY": "dummy.dummy.dummy",
+    "OPENAI_API_KEY": "sk-dummy",
+    "S3_BUCKET_NAME": "test-bucket",
+    "AWS_REGION": "us-east-1",
+    "AWS_ACCESS_KEY_ID": "testing",
+    "AWS_SECRET_ACCESS_KEY": "testing",
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+from crawler import BlockedURLError, ensure_public_url, is_public_address
+
+
+@pytest.mark.parametrize("address", [
+    "127.0.0.1",
+    "10.0.0.5",
+    "172.16.3.4",
+    "192.168.1.1",
+    "169.254.169.254",
+    "100.64.0.1",
+    "0.0.0.0",
+    "224.0.0.1",
+    "::1",
+    "fe80::1",
+    "fd00::1",
+    "::ffff:127.0.0.1",
+])
+def test_non_public_addresses_are_rejected(address):
+    assert not is_public_address(address)
+
+
+@pytest.mark.parametrize("address", ["93.184.216.34", "2606:2800:220:1:248:1893:25c8:1946"])
+def test_public_addresses_are_allowed(address):
+    assert is_public_address(address)
+
+
+@pytest.mark.parametrize("url", [
+    "http://127.0.0.1/admin",
+    "http://169.254.169.254/latest/meta-data/",
+    "http://[::1]:8080/",
+    "ftp://93.184.216.34/",
+])
+def test_ensure_public_url_blocks_internal_targets(url):
+    with pytest.raises(BlockedURLError):
+        asyncio.run(ensure_public_url(url))
+
+
+def test_ensure_public_url_allows_public_ip():
+    asyncio.run(ensure_public_url("https://93.184.216.34/page"))
@@ -0,0 +1,64 @@
+import pytest
+
+from pdf_pages import classify_page, image_coverage
+
+LETTER = (0, 0, 612, 792)
+
+
+def write_pdf(path, image_box, caption=None):
+    """ One letter page with a 4x4 grey image drawn at image_box (x, y, width, height) and an optional caption """
+    x, y, width, height = image_box
+    content = f"q {width} 0 0 {height} {x} {y} cm /Im1 Do Q".encode("latin-1")
+    if caption:
+        content += f"\nBT /F1 10 Tf {x} {y - 14} Td ({caption}) Tj ET".encode("latin-1")
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+        b"/Resources << /Font << /F1 4 0 R >> /XObject << /Im1 5 0 R >> >> /Contents 6 0 R >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        b"<< /Type /XObject /Subtype /Image /Width 4 /Height 4 /ColorSpace /DeviceGray "
+        b"/BitsPerComponent 8 /Length 16 >>\nstream\n" + b"\x80" * 16 + b"\nendstream",
+        b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream",
+    ]
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, 1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+
+        xref_offset = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset))
+
+
+def test_image_coverage_is_clipped_to_the_page():
+    assert image_coverage([(0, 0, 306, 792)], LETTER) == pytest.approx(0.5)
+    assert image_coverage([(-100, -100, 1000, 1000)], LETTER) == 1.0
+    assert image_coverage([], LETTER) == 0.0
+
+
+def test_small_image_with_short_caption_is_visual():
+    assert classify_page(chars=9, images=1, lines=0, image_coverage=0.05) == "visual"
+
+
+def test_full_page_image_without_text_is_scanned():
+    assert classify_page(chars=0, images=1, lines=0, image_coverage=0.98) == "scanned"
+
+
+def test_pdf_with_small_figure_and_caption_keeps_hi_res(tmp_path):
+    pytest.importorskip("pdfminer")
+    from pdf_pages import classify_pdf_pages
+
+    figure = tmp_path / "figure.pdf"
+    write_pdf(figure, (72, 500, 200, 150), caption="Figure 1")
+    scan = tmp_path / "scan.pdf"
+    write_pdf(scan, (0, 0, 612, 792))
+
+    assert classify_pdf_pages(str(figure)) == ["visual"]
+    assert classify_pdf_pages(str(scan)) == ["scanned"]
@@ -0,0 +1,35 @@
+import time
+
+from rate_limiter import RateLimiter
+
+
+def test_oversize_request_waits_for_empty_window():
+    limiter = RateLimiter(tokens_per_minute=100, window_seconds=0.3)
+    limiter.acquire(50)
+
+    now = time.monotonic()
+    assert limiter._wait_time(now, 500) > 0
+
+    started = time.monotonic()
+    limiter.acquire(500)
+    assert time.monotonic() - started >= 0.2
+
+
+def test_oversize_request_on_empty_window_is_admitted():
+    limiter = RateLimiter(tokens_per_minute=100, window_seconds=0.3)
+
+    started = time.monotonic()
+    limiter.acquire(500)
+    assert time.monotonic() - started < 0.1
+
+    # ...and nothing else fits until it has left the window
+    assert limiter._wait_time(time.monotonic(), 1) > 0
+
+
+def test_requests_within_budget_do_not_wait():
+    limiter = RateLimiter(requests_per_minute=10, tokens_per_minute=100, window_seconds=0.3)
+    for _ in range(4):
+        limiter.acquire(20)
+
+    assert limiter._wait_time(time.monotonic(), 20) == 0
+    assert limiter._wait_time(time.monotonic(), 30) > 0
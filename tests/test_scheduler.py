@@ -0,0 +1,44 @@
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("boto3")
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")  # fakeredis runs the redis lock scripts with Lua
+
+import scheduler
+
+
+@pytest.fixture
+def started(monkeypatch):
+    client = fakeredis.FakeRedis(decode_responses=True)
+    jobs = []
+    monkeypatch.setattr(scheduler, "_redis", client)
+    monkeypatch.setattr(scheduler, "_start_job", jobs.append)
+    monkeypatch.setattr(scheduler, "_report_positions", lambda *args: None)
+    return jobs
+
+
+def document(document_id, clerk_id, file_size):
+    return {
+        "id": document_id,
+        "project_id": f"project-{document_id}",
+        "clerk_id": clerk_id,
+        "filename": "report.pdf",
+        "file_size": file_size,
+    }
+
+
+def test_job_larger_than_many_quanta_is_dispatched_in_one_call(started):
+    # ~1.5 GB PDF: thousands of quanta of cost
+    scheduler.submit_documents([document("big", "tenant-a", 1500 * 1024 * 1024)])
+
+    assert [job["document_id"] for job in started] == ["big"]
+
+
+def test_cheaper_tenant_goes_first_when_nobody_can_afford(started):
+    scheduler.submit_documents([
+        document("huge", "tenant-a", 900 * 1024 * 1024),
+        document("large", "tenant-b", 300 * 1024 * 1024),
+    ])
+
+    assert [job["document_id"] for job in started] == ["large", "huge"]
@@ -0,0 +1,70 @@
+import pytest
+
+pytest.importorskip("dotenv")
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+
+from transfers import (
+    MULTIPART_MIN_PART_SIZE,
+    abort_multipart_upload,
+    complete_multipart_upload,
+    create_multipart_upload,
+    head_uploads,
+    object_size,
+    presign_upload_parts,
+)
+
+BUCKET = "test-bucket"
+KEY = "projects/p/documents/report.pdf"
+
+
+@pytest.fixture
+def s3():
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def test_multipart_upload_round_trip(s3):
+    upload_id = create_multipart_upload(KEY, "application/pdf", client=s3, bucket=BUCKET)
+
+    urls = presign_upload_parts(KEY, upload_id, [1, 2], client=s3, bucket=BUCKET)
+    assert [part["part_number"] for part in urls] == [1, 2]
+    assert all(upload_id in part["url"] for part in urls)
+
+    bodies = [b"a" * MULTIPART_MIN_PART_SIZE, b"b" * 1024]
+    parts = [
+        {
+            "part_number": number,
+            "etag": s3.upload_part(Bucket=BUCKET, Key=KEY, UploadId=upload_id, PartNumber=number, Body=body)["ETag"]
+        }
+        for number, body in zip([2, 1], reversed(bodies))
+    ]
+
+    etag = complete_multipart_upload(KEY, upload_id, parts, client=s3, bucket=BUCKET)
+
+    assert etag.endswith("-2")
+    assert object_size(KEY, client=s3, bucket=BUCKET) == sum(len(body) for body in bodies)
+    assert s3.get_object(Bucket=BUCKET, Key=KEY)["Body"].read(1) == b"a"
+
+
+def test_aborted_upload_leaves_no_parts(s3):
+    upload_id = create_multipart_upload(KEY, "application/pdf", client=s3, bucket=BUCKET)
+    s3.upload_part(Bucket=BUCKET, Key=KEY, UploadId=upload_id, PartNumber=1, Body=b"partial")
+
+    abort_multipart_upload(KEY, upload_id, client=s3, bucket=BUCKET)
+
+    assert not s3.list_multipart_uploads(Bucket=BUCKET).get("Uploads")
+    with pytest.raises(s3.exceptions.ClientError):
+        s3.head_object(Bucket=BUCKET, Key=KEY)
+
+
+def test_head_uploads_reports_s3_size_and_skips_missing_keys(s3):
+    s3.put_object(Bucket=BUCKET, Key=KEY, Body=b"x" * 2048)
+
+    uploads = head_uploads([KEY, "projects/p/documents/missing.pdf"], client=s3, bucket=BUCKET)
+
+    assert [upload["s3_key"] for upload in uploads] == [KEY]
+    assert uploads[0]["file_size"] == 2048
+    assert uploads[0]["content_fingerprint"].startswith("etag:")
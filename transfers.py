@@ -0,0 +1,147 @@
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from database import BUCKET_NAME, s3_client
+
+# Multipart uploads (S3 limits: parts of at least 5 MB except the last, at most 10,000 parts)
+MULTIPART_PART_SIZE = int(os.getenv("MULTIPART_PART_SIZE", str(16 * 1024 * 1024)))
+MULTIPART_MIN_PART_SIZE = 5 * 1024 * 1024
+MULTIPART_MAX_PARTS = 10000
+MULTIPART_URL_EXPIRES_SECONDS = int(os.getenv("MULTIPART_URL_EXPIRES_SECONDS", "3600"))
+
+# Upload confirmation: HEADs issued in parallel when a batch is confirmed
+CONFIRM_HEAD_CONCURRENCY = int(os.getenv("CONFIRM_HEAD_CONCURRENCY", "16"))
+
+# Worker downloads: small objects are read in one GET, larger ones use parallel ranged GETs
+DOWNLOAD_SPOOL_MAX_BYTES = int(os.getenv("DOWNLOAD_SPOOL_MAX_BYTES", str(8 * 1024 * 1024)))
+DOWNLOAD_PART_SIZE = int(os.getenv("DOWNLOAD_PART_SIZE", str(16 * 1024 * 1024)))
+DOWNLOAD_CONCURRENCY = int(os.getenv("DOWNLOAD_CONCURRENCY", "8"))
+
+
+def plan_multipart_upload(file_size: int, part_size: int = MULTIPART_PART_SIZE) -> tuple:
+    """ (part_size, part_count) for a file, growing the part size if it would need too many parts """
+    part_size = max(part_size, MULTIPART_MIN_PART_SIZE)
+    if file_size > part_size * MULTIPART_MAX_PARTS:
+        part_size = math.ceil(file_size / MULTIPART_MAX_PARTS)
+
+    return part_size, max(math.ceil(file_size / part_size), 1)
+
+
+def create_multipart_upload(s3_key: str, file_type: str, client=s3_client, bucket: str = BUCKET_NAME) -> str:
+    response = client.create_multipart_upload(Bucket=bucket, Key=s3_key, ContentType=file_type)
+    return response["UploadId"]
+
+
+def presign_upload_parts(s3_key: str, upload_id: str, part_numbers: list,
+                         client=s3_client, bucket: str = BUCKET_NAME) -> list:
+    """ Presigned PUT URL for each part; signing is local so this costs no S3 round trips """
+    return [
+        {
+            "part_number": part_number,
+            "url": client.generate_presigned_url(
+                "upload_part",
+                Params={
+                    "Bucket": bucket,
+                    "Key": s3_key,
+                    "UploadId": upload_id,
+                    "PartNumber": part_number
+                },
+                ExpiresIn=MULTIPART_URL_EXPIRES_SECONDS
+            )
+        }
+        for part_number in part_numbers
+    ]
+
+
+def complete_multipart_upload(s3_key: str, upload_id: str, parts: list,
+                              client=s3_client, bucket: str = BUCKET_NAME) -> str:
+    """ Assemble the uploaded parts ({part_number, etag}) and return the object's ETag """
+    response = client.complete_multipart_upload(
+        Bucket=bucket,
+        Key=s3_key,
+        UploadId=upload_id,
+        MultipartUpload={
+            "Parts": [
+                {"PartNumber": part["part_number"], "ETag": part["etag"]}
+                for part in sorted(parts, key=lambda part: part["part_number"])
+            ]
+        }
+    )
+    return response.get("ETag", "").strip('"')
+
+
+def object_size(s3_key: str, client=s3_client, bucket: str = BUCKET_NAME) -> int:
+    """ Size S3 reports for an object, e.g. to replace a client-declared file size """
+    return client.head_object(Bucket=bucket, Key=s3_key)["ContentLength"]
+
+
+def head_uploads(s3_keys: list, client=s3_client, bucket: str = BUCKET_NAME) -> list:
+    """
+        {s3_key, file_size, content_fingerprint} for every key that exists in S3, taken from
+        a HEAD of the object rather than what the client declared; missing keys are left out
+    """
+    def head(s3_key: str):
+        try:
+            response = client.head_object(Bucket=bucket, Key=s3_key)
+        except client.exceptions.ClientError:
+            return None
+
+        etag = response.get("ETag", "").strip('"')
+        return {
+            "s3_key": s3_key,
+            "file_size": response["ContentLength"],
+            "content_fingerprint": f"etag:{etag}" if etag else None
+        }
+
+    with ThreadPoolExecutor(max_workers=CONFIRM_HEAD_CONCURRENCY) as executor:
+        return [upload for upload in executor.map(head, s3_keys) if upload]
+
+
+def abort_multipart_upload(s3_key: str, upload_id: str, client=s3_client, bucket: str = BUCKET_NAME):
+    """ Discard an unfinished upload so its parts stop taking up storage """
+    client.abort_multipart_upload(Bucket=bucket, Key=s3_key, UploadId=upload_id)
+
+
+def download_object(s3_key: str, path: str, size: int = None, client=s3_client, bucket: str = BUCKET_NAME) -> dict:
+    """
+        Download an object to path. Objects up to DOWNLOAD_SPOOL_MAX_BYTES are read
+        with a single GET; larger ones are fetched as parallel ranged GETs.
+        size (e.g. the document's file_size) saves a HEAD request when known.
+        Returns transfer metrics.
+    """
+    from boto3.s3.transfer import TransferConfig
+
+    start_time = time.time()
+
+    if size is None:
+        size = client.head_object(Bucket=bucket, Key=s3_key)["ContentLength"]
+
+    if size <= DOWNLOAD_SPOOL_MAX_BYTES:
+        # Streamed in blocks so an understated size can't blow up memory
+        mode = "single"
+        body = client.get_object(Bucket=bucket, Key=s3_key)["Body"]
+        with open(path, "wb") as f:
+            for block in body.iter_chunks(chunk_size=1024 * 1024):
+                f.write(block)
+        size = os.path.getsize(path)
+
+    else:
+        mode = "ranged"
+        config = TransferConfig(
+            multipart_threshold=DOWNLOAD_SPOOL_MAX_BYTES,
+            multipart_chunksize=DOWNLOAD_PART_SIZE,
+            max_concurrency=DOWNLOAD_CONCURRENCY,
+            use_threads=True
+        )
+        client.download_file(bucket, s3_key, path, Config=config)
+        size = os.path.getsize(path)
+
+    seconds = time.time() - start_time
+    return {
+        "mode": mode,
+        "bytes": size,
+        "seconds": round(seconds, 3),
+        "megabytes_per_second": round(size / (1024 * 1024) / seconds, 2) if seconds else None
+    }
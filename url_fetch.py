@@ -0,0 +1,80 @@
+import hashlib
+import os
+
+# Which transport fetches URL sources: "scrapingbee" (default) or "http" (direct, e.g. for a local test server)
+URL_FETCH_TRANSPORT = os.getenv("URL_FETCH_TRANSPORT", "scrapingbee")
+URL_FETCH_TIMEOUT = float(os.getenv("URL_FETCH_TIMEOUT", "60"))
+
+
+class FetchResponse:
+    """ Transport-independent response: status code, body and lower-cased headers """
+
+    def __init__(self, status_code: int, content: bytes, headers: dict):
+        self.status_code = status_code
+        self.content = content
+        self.headers = {name.lower(): value for name, value in headers.items()}
+
+    def header(self, name: str):
+        # ScrapingBee forwards the target's headers with an Spb- prefix
+        name = name.lower()
+        return self.headers.get(name) or self.headers.get(f"spb-{name}")
+
+    @property
+    def not_modified(self) -> bool:
+        return self.status_code == 304
+
+    @property
+    def etag(self):
+        return self.header("etag")
+
+    @property
+    def last_modified(self):
+        return self.header("last-modified")
+
+
+class HttpTransport:
+    """ Direct HTTP fetch with requests """
+
+    def fetch(self, url: str, headers: dict = None) -> FetchResponse:
+        import requests
+
+        response = requests.get(url, headers=headers or {}, timeout=URL_FETCH_TIMEOUT)
+        return FetchResponse(response.status_code, response.content, dict(response.headers))
+
+
+class ScrapingBeeTransport:
+    """ Fetch through ScrapingBee (JS rendering, proxies); request headers are forwarded to the target """
+
+    def __init__(self):
+        from scrapingbee import ScrapingBeeClient
+
+        self.client = ScrapingBeeClient(api_key=os.getenv('SCRAPINGBEE_API_KEY'))
+
+    def fetch(self, url: str, headers: dict = None) -> FetchResponse:
+        response = self.client.get(url, headers=headers or None)
+        status_code = int(response.headers.get("Spb-initial-status-code", response.status_code))
+        return FetchResponse(status_code, response.content, dict(response.headers))
+
+
+TRANSPORTS = {
+    "http": HttpTransport,
+    "scrapingbee": ScrapingBeeTransport,
+}
+
+
+def get_transport(name: str = None):
+    return TRANSPORTS[name or URL_FETCH_TRANSPORT]()
+
+
+def conditional_headers(etag: str = None, last_modified: str = None) -> dict:
+    """ If-None-Match / If-Modified-Since headers from the last fetch """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return headers
+
+
+def content_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()